@@ -0,0 +1,397 @@
+# FILE: dlc3_analyze.py
+# Purpose: Analyze videos with a trained DLC3 snapshot — batched CPU inference fed by a prefetching decoder.
+# Version: v1, flat memory for any video length, crop from video_sets, resumable after interruption.
+#
+# Per video, a background thread decodes frames into a bounded queue while the main thread runs
+# batched inference. Predictions are appended to <video><scorer>.predictions.bin as they come, with a
+# small progress file; once a video is complete they are converted chunk-wise to DLC's .h5 format.
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+PROGRESS_SUFFIX = ".progress.json"
+PREDICTIONS_SUFFIX = ".predictions.bin"
+H5_CHUNK_ROWS = 10000
+
+
+# ===================================================================
+# SNAPSHOT / MODEL
+# ===================================================================
+
+def select_snapshot(train_folder, which="best"):
+    """Returns (epoch, path) for 'best', 'latest' or an epoch number; 'best' falls back to the latest."""
+    from dlc3_v5 import find_snapshots
+
+    snapshots = find_snapshots(str(train_folder))
+    best = sorted(Path(train_folder).glob("snapshot-best-*.pt"))
+    if which == "best" and best:
+        return int(best[-1].stem.split("-")[-1]), best[-1]
+    if not snapshots:
+        raise FileNotFoundError(f"❌ No snapshots found in {train_folder}")
+    if which in ("best", "latest"):
+        epoch = max(snapshots)
+    else:
+        epoch = int(which)
+        if epoch not in snapshots:
+            raise FileNotFoundError(f"❌ No snapshot for epoch {epoch} in {train_folder}")
+    return epoch, Path(snapshots[epoch])
+
+
+def scorer_name(model_cfg, config, shuffle, epoch):
+    """DLC-style scorer name, e.g. DLC_Resnet50_FebOct3shuffle1_snapshot_200."""
+    net = str(model_cfg.get("net_type", "model")).replace("_", "").capitalize()
+    return f"DLC_{net}_{config['Task']}{config['date']}shuffle{shuffle}_snapshot_{epoch:03d}"
+
+
+def build_pose_runner(model_cfg, snapshot_path, batch_size, device):
+    """Creates DLC's pose inference runner for a bottom-up model."""
+    from deeplabcut.pose_estimation_pytorch.apis.utils import get_inference_runners
+
+    metadata = model_cfg["metadata"]
+    pose_runner, _ = get_inference_runners(
+        model_config=model_cfg,
+        snapshot_path=str(snapshot_path),
+        max_individuals=max(len(metadata.get("individuals") or []), 1),
+        num_bodyparts=len(metadata["bodyparts"]),
+        num_unique_bodyparts=len(metadata.get("unique_bodyparts") or []),
+        batch_size=batch_size,
+        device=device,
+        with_identity=metadata.get("with_identity", False),
+    )
+    return pose_runner
+
+
+def parse_crop(crop, width, height):
+    """Parses a video_sets crop ('x1,x2,y1,y2' or list) into ints clipped to the frame size."""
+    if crop is None:
+        return 0, width, 0, height
+    if isinstance(crop, str):
+        crop = crop.split(",")
+    x1, x2, y1, y2 = (int(float(c)) for c in crop)
+    return max(x1, 0), min(x2, width), max(y1, 0), min(y2, height)
+
+
+# ===================================================================
+# PREFETCHING DECODER
+# ===================================================================
+
+class FramePrefetcher(threading.Thread):
+    """
+    Decodes frames on a background thread into a bounded queue of batches (RGB, cropped).
+
+    The queue holds at most `max_batches` batches, so memory stays constant however long the video is.
+    """
+
+    _END = object()
+
+    def __init__(self, video_path, start_frame, crop, batch_size, max_batches=4):
+        super().__init__(daemon=True)
+        self.video_path = str(video_path)
+        self.start_frame = start_frame
+        self.crop = crop
+        self.batch_size = batch_size
+        self.batches = queue.Queue(maxsize=max_batches)
+        self.error = None
+        self._stop_event = threading.Event()
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.video_path)
+        if not cap.isOpened():
+            raise IOError(f"OpenCV could not open {self.video_path}")
+        if self.start_frame:
+            cap.set(cv2.CAP_PROP_POS_FRAMES, self.start_frame)
+            if int(cap.get(cv2.CAP_PROP_POS_FRAMES)) != self.start_frame:
+                # Inexact seeking (some AVI codecs): reopen and skip frame by frame
+                cap.release()
+                cap = cv2.VideoCapture(self.video_path)
+                for _ in range(self.start_frame):
+                    if not cap.grab():
+                        break
+        return cap
+
+    def _put(self, item):
+        while not self._stop_event.is_set():
+            try:
+                self.batches.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(self):
+        x1, x2, y1, y2 = self.crop
+        cap = None
+        try:
+            cap = self._open()
+            batch = []
+            while not self._stop_event.is_set():
+                ok, frame = cap.read()
+                if not ok:
+                    break
+                batch.append(cv2.cvtColor(frame[y1:y2, x1:x2], cv2.COLOR_BGR2RGB))
+                if len(batch) == self.batch_size:
+                    if not self._put(batch):
+                        return
+                    batch = []
+            if batch:
+                self._put(batch)
+        except Exception as e:
+            self.error = e
+        finally:
+            if cap is not None:
+                cap.release()
+            self._put(self._END)
+
+    def __iter__(self):
+        while True:
+            batch = self.batches.get()
+            if batch is self._END:
+                if self.error is not None:
+                    raise self.error
+                return
+            yield batch
+
+    def stop(self):
+        self._stop_event.set()
+
+
+# ===================================================================
+# STREAMED OUTPUT
+# ===================================================================
+
+def _prediction_row(prediction, num_unique):
+    """Flattens one frame's runner output into x, y, likelihood triplets."""
+    row = [np.asarray(prediction["bodyparts"], dtype=np.float32)[..., :3].reshape(-1)]
+    if num_unique:
+        row.append(np.asarray(prediction["unique_bodyparts"], dtype=np.float32)[..., :3].reshape(-1))
+    return np.concatenate(row)
+
+
+def _column_index(model_cfg, scorer):
+    import pandas as pd
+
+    metadata = model_cfg["metadata"]
+    bodyparts = metadata["bodyparts"]
+    individuals = metadata.get("individuals") or ["animal"]
+    unique = metadata.get("unique_bodyparts") or []
+    coords = ["x", "y", "likelihood"]
+    if len(individuals) > 1 or unique:
+        cols = [(scorer, ind, bp, c) for ind in individuals for bp in bodyparts for c in coords]
+        cols += [(scorer, "single", bp, c) for bp in unique for c in coords]
+        return pd.MultiIndex.from_tuples(cols, names=["scorer", "individuals", "bodyparts", "coords"])
+    cols = [(scorer, bp, c) for bp in bodyparts for c in coords]
+    return pd.MultiIndex.from_tuples(cols, names=["scorer", "bodyparts", "coords"])
+
+
+def write_h5(bin_path, h5_path, columns):
+    """Converts the raw prediction file to DLC's .h5 table chunk by chunk (memory stays flat)."""
+    import pandas as pd
+
+    tmp_path = h5_path.with_name(h5_path.name + ".tmp")
+    if os.path.getsize(bin_path) == 0:  # video without a single readable frame
+        pd.DataFrame(columns=columns, dtype=np.float32).to_hdf(tmp_path, key="df_with_missing", format="table")
+        os.replace(tmp_path, h5_path)
+        return
+    data = np.memmap(bin_path, dtype=np.float32, mode="r").reshape(-1, len(columns))
+    with pd.HDFStore(tmp_path, mode="w") as store:
+        for start in range(0, len(data), H5_CHUNK_ROWS):
+            chunk = np.array(data[start:start + H5_CHUNK_ROWS])
+            df = pd.DataFrame(chunk, columns=columns, index=np.arange(start, start + len(chunk)))
+            store.append("df_with_missing", df, format="table")
+    del data
+    os.replace(tmp_path, h5_path)
+
+
+def analyze_video(video_path, pose_runner, model_cfg, scorer, crop, batch_size, max_batches=4, destfolder=None):
+    """Analyzes one video, resuming from its progress file if a previous run was interrupted."""
+    video_path = Path(video_path)
+    out_dir = Path(destfolder) if destfolder else video_path.parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+    base = out_dir / f"{video_path.stem}{scorer}"
+    h5_path = base.with_name(base.name + ".h5")
+    bin_path = base.with_name(base.name + PREDICTIONS_SUFFIX)
+    progress_path = base.with_name(base.name + PROGRESS_SUFFIX)
+
+    if h5_path.exists() and not progress_path.exists():
+        print(f"✅ Already analyzed: {h5_path.name}")
+        return h5_path
+
+    cap = cv2.VideoCapture(str(video_path))
+    width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    x1, x2, y1, y2 = parse_crop(crop, width, height)
+
+    columns = _column_index(model_cfg, scorer)
+    row_bytes = len(columns) * 4
+    num_unique = len(model_cfg["metadata"].get("unique_bodyparts") or [])
+
+    done = 0
+    if progress_path.exists() and bin_path.exists():
+        with open(progress_path, "r", encoding="utf-8") as f:
+            progress = json.load(f)
+        if progress.get("crop") == [x1, x2, y1, y2] and progress.get("row_bytes") == row_bytes:
+            done = progress["frames_done"]
+    # Drop anything written after the last recorded frame (partial batch of a crash)
+    with open(bin_path, "ab") as f:
+        f.truncate(done * row_bytes)
+
+    if done:
+        print(f"▶️ Resuming {video_path.name} at frame {done}/{total}")
+    else:
+        print(f"🎞 Analyzing {video_path.name} ({total} frames, crop {x1},{x2},{y1},{y2})")
+
+    prefetcher = FramePrefetcher(video_path, done, (x1, x2, y1, y2), batch_size, max_batches)
+    prefetcher.start()
+    start, last_report = time.time(), time.time()
+    frames_this_run = 0
+    try:
+        with open(bin_path, "ab") as out:
+            for frames in prefetcher:
+                predictions = pose_runner.inference(frames)
+                rows = np.stack([_prediction_row(p, num_unique) for p in predictions])
+                rows[:, 0::3] += x1  # back to full-frame coordinates
+                rows[:, 1::3] += y1
+                out.write(rows.astype(np.float32).tobytes())
+                out.flush()
+                done += len(frames)
+                frames_this_run += len(frames)
+                tmp_progress = progress_path.with_name(progress_path.name + ".tmp")
+                with open(tmp_progress, "w", encoding="utf-8") as f:
+                    json.dump({"frames_done": done, "total": total, "crop": [x1, x2, y1, y2],
+                               "row_bytes": row_bytes}, f)
+                os.replace(tmp_progress, progress_path)
+                if time.time() - last_report > 10:
+                    rate = frames_this_run / (time.time() - start)
+                    print(f"   {done}/{total} frames ({rate:.1f} fps)")
+                    last_report = time.time()
+    finally:
+        prefetcher.stop()
+
+    write_h5(bin_path, h5_path, columns)
+    bin_path.unlink()
+    progress_path.unlink()
+    elapsed = time.time() - start
+    print(f"✅ {video_path.name}: {frames_this_run} frames in {elapsed:.1f} s "
+          f"({frames_this_run / max(elapsed, 1e-9):.1f} fps) → {h5_path.name}")
+    return h5_path
+
+
+def dlc_snapshot_index(train_folder, epoch, snapshot_path):
+    """The snapshot as DLC's snapshot_index counts it: regular snapshots by epoch, the best one last."""
+    from dlc3_v5 import find_snapshots
+
+    if Path(snapshot_path).name.startswith("snapshot-best-"):
+        return "best"
+    return sorted(find_snapshots(str(train_folder))).index(epoch)
+
+
+def analyze_videos_top_down(config_path, videos, crops, shuffle, train_folder, epoch, snapshot_path, batch_size,
+                            device, destfolder):
+    """
+    Runs deeplabcut.analyze_videos one video at a time with the chosen snapshot and the video's crop.
+    DLC skips videos whose .h5 already exists, so an interrupted run continues with the next video.
+    Returns the .h5 paths DLC wrote.
+    """
+    import deeplabcut
+    try:
+        from deeplabcut.pose_estimation_pytorch.runners.snapshots import is_compressed_snapshot
+    except ImportError:  # stock snapshots.py never writes compressed snapshots
+        def is_compressed_snapshot(path):
+            return False
+
+    if is_compressed_snapshot(snapshot_path):
+        raise ValueError(f"❌ {Path(snapshot_path).name} is stored compressed, which deeplabcut.analyze_videos "
+                         "cannot read — choose the best or the latest snapshot for top-down models.")
+    snapshot_index = dlc_snapshot_index(train_folder, epoch, snapshot_path)
+
+    results = []
+    for video in videos:
+        kwargs = {}
+        crop = crops.get(os.path.normcase(os.path.abspath(video)))
+        if crop is not None:
+            cap = cv2.VideoCapture(str(video))
+            width, height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            cap.release()
+            x1, x2, y1, y2 = parse_crop(crop, width, height)
+            if (x1, x2, y1, y2) != (0, width, 0, height):
+                kwargs["cropping"] = [x1, x2, y1, y2]
+        scorer = deeplabcut.analyze_videos(str(config_path), [str(video)], shuffle=shuffle,
+                                           snapshot_index=snapshot_index, batch_size=batch_size, device=device,
+                                           destfolder=destfolder, **kwargs)
+        output_dir = Path(destfolder) if destfolder else Path(video).parent
+        results.append(output_dir / f"{Path(video).stem}{scorer}.h5")
+    return results
+
+
+def analyze_videos(config_path, videos=None, shuffle=1, snapshot="best", batch_size=16, max_batches=4,
+                   device="cpu", destfolder=None):
+    """Analyzes the given videos (default: all of video_sets) with the chosen snapshot of a shuffle."""
+    from dlc3_v5 import find_train_folder, loadable_snapshot
+
+    config_path = Path(config_path)
+    with open(config_path, "r", encoding="utf-8") as f:
+        config = yaml.safe_load(f)
+    video_sets = config.get("video_sets") or {}
+    crops = {os.path.normcase(os.path.abspath(v)): (s or {}).get("crop") for v, s in video_sets.items()}
+    videos = list(videos) if videos else list(video_sets)
+
+    train_folder = find_train_folder(config_path, shuffle=shuffle)
+    if train_folder is None:
+        raise FileNotFoundError(f"❌ No training folder found for shuffle {shuffle}.")
+    with open(train_folder / "pytorch_config.yaml", "r") as f:
+        model_cfg = yaml.safe_load(f)
+    epoch, snapshot_path = select_snapshot(train_folder, snapshot)
+    print(f"🧠 Using snapshot: {snapshot_path.name}")
+
+    if str(model_cfg.get("method", "bu")).lower() == "td":
+        # Top-down models need the detector pipeline: use DLC's own implementation
+        print("ℹ️ Top-down model: falling back to deeplabcut.analyze_videos.")
+        return analyze_videos_top_down(config_path, videos, crops, shuffle, train_folder, epoch, snapshot_path,
+                                       batch_size, device, destfolder)
+
+    with loadable_snapshot(snapshot_path) as weights_path:  # compressed snapshots: temporary fp32 copy
+        pose_runner = build_pose_runner(model_cfg, weights_path, batch_size, device)
+    scorer = scorer_name(model_cfg, config, shuffle, epoch)
+    results = []
+    for video in videos:
+        crop = crops.get(os.path.normcase(os.path.abspath(video)))
+        results.append(analyze_video(video, pose_runner, model_cfg, scorer, crop, batch_size, max_batches,
+                                     destfolder))
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze videos with a trained DLC3 model (batched, resumable).")
+    parser.add_argument("config", nargs="?", help="path to the project's config.yaml")
+    parser.add_argument("videos", nargs="*", help="videos to analyze (default: all videos in video_sets)")
+    parser.add_argument("--shuffle", type=int, default=1)
+    parser.add_argument("--snapshot", default="best", help="'best', 'latest' or an epoch number (default best)")
+    parser.add_argument("--batch-size", type=int, default=16, help="frames per inference batch (default 16)")
+    parser.add_argument("--queue", type=int, default=4, help="decoded batches buffered ahead (default 4)")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--destfolder", default=None, help="where to write results (default: next to each video)")
+    args = parser.parse_args()
+
+    config_path = args.config or input("Enter full path to your DLC config.yaml: ").strip().strip('"')
+    if not Path(config_path).exists():
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+    try:
+        analyze_videos(config_path, args.videos, shuffle=args.shuffle, snapshot=args.snapshot,
+                       batch_size=args.batch_size, max_batches=args.queue, device=args.device,
+                       destfolder=args.destfolder)
+    except KeyboardInterrupt:
+        print("\n🛑 Interrupted — run the same command again to resume.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+# FILE: dlc3_autotune.py
+# Purpose: Find the fastest batch_size / dataloader_workers / torch thread count for CPU training.
+# Version: v1, short timed trials on the real dataset, writes the winner into pytorch_config.yaml.
+#
+# Every trial runs in a fresh process (so torch thread settings and peak memory are isolated) and times
+# a few forward/backward/optimizer steps after a warm-up. The report is kept next to pytorch_config.yaml.
+
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+REPORT_FILENAME = "autotune_report.json"
+
+
+# ===================================================================
+# PEAK MEMORY
+# ===================================================================
+
+class PeakMemorySampler:
+    """Samples the RSS of this process and its children (data-loader workers) in a background thread."""
+
+    def __init__(self, interval=0.05):
+        self.interval = interval
+        self.peak_bytes = 0
+        self._stop = threading.Event()
+        self._thread = None
+        try:
+            import psutil
+            self._process = psutil.Process()
+        except ImportError:
+            self._process = None
+
+    def _sample(self):
+        total = self._process.memory_info().rss
+        for child in self._process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except Exception:  # worker exited in between
+                pass
+        self.peak_bytes = max(self.peak_bytes, total)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def __enter__(self):
+        if self._process is not None:
+            self._sample()
+            self._thread = threading.Thread(target=self._run, daemon=True)
+            self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        else:
+            # Without psutil fall back to the OS high-water mark (Unix only, kB on Linux)
+            try:
+                import resource
+                self.peak_bytes = (resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+                                   + resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) * 1024
+            except ImportError:
+                self.peak_bytes = 0
+
+
+# ===================================================================
+# ONE TRIAL (runs in its own process)
+# ===================================================================
+
+def _run_trial(config_path, shuffle, batch_size, workers, threads, warmup_steps, timed_steps, results):
+    try:
+        import torch
+        torch.set_num_threads(threads)
+
+        # Read frames the same way training will (from the image cache, if the project has one)
+        from dlc3_image_cache import prepare_image_cache_for_training
+        prepare_image_cache_for_training(config_path)
+
+        from deeplabcut.pose_estimation_pytorch.data import DLCLoader
+        from deeplabcut.pose_estimation_pytorch.data.transforms import build_transforms
+        from deeplabcut.pose_estimation_pytorch.models import PoseModel
+        from deeplabcut.pose_estimation_pytorch.task import Task
+
+        loader = DLCLoader(config=str(config_path), shuffle=shuffle, trainset_index=0)
+        model_cfg = loader.model_cfg
+        dataset = loader.create_dataset(
+            transform=build_transforms(model_cfg["data"]["train"]),
+            mode="train",
+            task=Task(model_cfg["method"]),
+        )
+        if len(dataset) < batch_size:
+            results.put({"status": "skipped", "error": f"only {len(dataset)} training images"})
+            return
+
+        collate_fn = None
+        collate_cfg = model_cfg["data"]["train"].get("collate")
+        if collate_cfg:
+            from deeplabcut.pose_estimation_pytorch.data.collate import COLLATE_FUNCTIONS
+            collate_fn = COLLATE_FUNCTIONS.build(collate_cfg)
+
+        data = torch.utils.data.DataLoader(
+            dataset, batch_size=batch_size, shuffle=True, num_workers=workers,
+            collate_fn=collate_fn, drop_last=True, persistent_workers=workers > 0,
+        )
+        model = PoseModel.build(model_cfg["model"])
+        model.train()
+        lr = model_cfg.get("runner", {}).get("optimizer", {}).get("params", {}).get("lr", 1e-4)
+        optimizer = torch.optim.AdamW(model.parameters(), lr=lr)
+
+        def batches():
+            while True:
+                yield from data
+
+        with PeakMemorySampler() as memory:
+            stream = batches()
+            for step in range(warmup_steps + timed_steps):
+                if step == warmup_steps:
+                    start = time.perf_counter()
+                batch = next(stream)
+                optimizer.zero_grad()
+                outputs = model(batch["image"])
+                target = model.get_target(outputs, batch["annotations"])
+                losses = model.get_loss(outputs, target)
+                losses["total_loss"].backward()
+                optimizer.step()
+            elapsed = time.perf_counter() - start
+
+        results.put({
+            "status": "ok",
+            "images_per_second": round(timed_steps * batch_size / elapsed, 2),
+            "seconds_per_step": round(elapsed / timed_steps, 4),
+            "peak_memory_mb": round(memory.peak_bytes / 2**20, 1) if memory.peak_bytes else None,
+        })
+    except Exception as e:
+        results.put({"status": "failed", "error": f"{type(e).__name__}: {e}"})
+
+
+def run_trial(config_path, shuffle, batch_size, workers, threads, warmup_steps=2, timed_steps=8, timeout=900):
+    """Runs one configuration in a fresh process and returns its measurements."""
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    process = ctx.Process(target=_run_trial, args=(str(config_path), shuffle, batch_size, workers, threads,
+                                                   warmup_steps, timed_steps, results))
+    process.start()
+    try:
+        result = results.get(timeout=timeout)
+    except Exception:
+        result = {"status": "failed", "error": f"no result within {timeout} s"}
+    process.join(timeout=10)
+    if process.is_alive():
+        process.terminate()
+    if result["status"] == "ok" and process.exitcode not in (0, None):
+        result = {"status": "failed", "error": f"trial process exited with code {process.exitcode}"}
+    return {"batch_size": batch_size, "dataloader_workers": workers, "torch_threads": threads, **result}
+
+
+# ===================================================================
+# GRID + CONFIG UPDATE
+# ===================================================================
+
+def default_grid():
+    """Batch sizes, worker counts and thread counts worth trying on this machine."""
+    cores = os.cpu_count() or 1
+    return {
+        "batch_sizes": [4, 8, 16],
+        "dataloader_workers": sorted({0, 2, min(4, max(cores // 4, 1))}),
+        "torch_threads": sorted({max(cores // 2, 1), cores}),
+    }
+
+
+def run_autotune(config_path, train_folder, shuffle=1, grid=None, warmup_steps=2, timed_steps=8,
+                 max_memory_mb=None, write=True):
+    """
+    Runs the trial grid, writes the best batch_size / dataloader_workers into pytorch_config.yaml and
+    the full benchmark (including the best torch thread count) into autotune_report.json.
+    Returns the report dict.
+    """
+    train_folder = Path(train_folder)
+    grid = {**default_grid(), **(grid or {})}
+    combos = list(itertools.product(grid["batch_sizes"], grid["dataloader_workers"], grid["torch_threads"]))
+
+    print(f"\n⏱ Autotuning on CPU: {len(combos)} trial(s), {timed_steps} timed steps each...")
+    trials = []
+    for i, (batch_size, workers, threads) in enumerate(combos, 1):
+        result = run_trial(config_path, shuffle, batch_size, workers, threads, warmup_steps, timed_steps)
+        trials.append(result)
+        if result["status"] == "ok":
+            memory = f", peak {result['peak_memory_mb']} MB" if result["peak_memory_mb"] else ""
+            print(f"   [{i}/{len(combos)}] batch {batch_size:>3}, workers {workers}, threads {threads:>3}: "
+                  f"{result['images_per_second']:.1f} img/s{memory}")
+        else:
+            print(f"   [{i}/{len(combos)}] batch {batch_size:>3}, workers {workers}, threads {threads:>3}: "
+                  f"{result['status']} ({result['error']})")
+
+    candidates = [t for t in trials if t["status"] == "ok"]
+    if max_memory_mb is not None:
+        unmeasured = [t for t in candidates if not t["peak_memory_mb"]]
+        if unmeasured:
+            # No peak memory (neither psutil nor resource available): cannot prove they fit under the cap
+            print(f"⚠️ {len(unmeasured)} trial(s) without a peak memory measurement are excluded by "
+                  f"--max-memory-mb (install psutil to measure them).")
+        candidates = [t for t in candidates if t["peak_memory_mb"] and t["peak_memory_mb"] <= max_memory_mb]
+    best = max(candidates, key=lambda t: t["images_per_second"]) if candidates else None
+
+    report = {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "config": str(config_path),
+        "shuffle": shuffle,
+        "cpu_count": os.cpu_count(),
+        "warmup_steps": warmup_steps,
+        "timed_steps": timed_steps,
+        "max_memory_mb": max_memory_mb,
+        "best": best,
+        "trials": trials,
+    }
+    with open(train_folder / REPORT_FILENAME, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"📄 Benchmark report written to {train_folder / REPORT_FILENAME}")
+
+    if best is None:
+        print("⚠️ No trial succeeded — pytorch_config.yaml left unchanged.")
+        return report
+
+    print(f"🏆 Best: batch_size={best['batch_size']}, dataloader_workers={best['dataloader_workers']}, "
+          f"torch threads={best['torch_threads']} ({best['images_per_second']:.1f} img/s)")
+    if write:
+        pytorch_config_path = train_folder / "pytorch_config.yaml"
+        with open(pytorch_config_path, "r") as f:
+            pt_cfg = yaml.safe_load(f)
+        train_settings = pt_cfg.setdefault("train_settings", {})
+        train_settings["batch_size"] = best["batch_size"]
+        train_settings["dataloader_workers"] = best["dataloader_workers"]
+        with open(pytorch_config_path, "w") as f:
+            yaml.dump(pt_cfg, f)
+        print("✅ Updated pytorch_config.yaml with the autotuned batch_size and dataloader_workers.")
+    return report
+
+
+_DEFAULT_TORCH_THREADS = None
+
+
+def apply_autotuned_threads(train_folder):
+    """
+    Sets torch's intra-op thread count from autotune_report.json, if the run was autotuned.
+    Otherwise torch's default thread count is restored, so a count applied for an earlier project in
+    the same process does not carry over. Returns the autotuned count, or None.
+    """
+    global _DEFAULT_TORCH_THREADS
+    import torch
+    if _DEFAULT_TORCH_THREADS is None:
+        _DEFAULT_TORCH_THREADS = torch.get_num_threads()  # first call: nothing was changed here yet
+
+    best = None
+    report_path = Path(train_folder) / REPORT_FILENAME if train_folder else None
+    if report_path is not None and report_path.exists():
+        with open(report_path, "r", encoding="utf-8") as f:
+            best = json.load(f).get("best")
+    if not best:
+        torch.set_num_threads(_DEFAULT_TORCH_THREADS)
+        return None
+    torch.set_num_threads(best["torch_threads"])
+    print(f"⚙️ Using {best['torch_threads']} torch threads (from {REPORT_FILENAME}).")
+    return best["torch_threads"]
+
+
+def _int_list(text):
+    return [int(x) for x in text.split(",") if x.strip()]
+
+
+def main():
+    from dlc3_v5 import find_train_folder
+
+    parser = argparse.ArgumentParser(description="Autotune CPU training settings of a DLC3 training run.")
+    parser.add_argument("config", nargs="?", help="path to the project's config.yaml")
+    parser.add_argument("--shuffle", type=int, default=1)
+    parser.add_argument("--batch-sizes", type=_int_list, default=None, help="e.g. 4,8,16")
+    parser.add_argument("--workers", type=_int_list, default=None, help="data-loader worker counts, e.g. 0,2,4")
+    parser.add_argument("--threads", type=_int_list, default=None, help="torch thread counts, e.g. 8,16")
+    parser.add_argument("--steps", type=int, default=8, help="timed steps per trial (default 8)")
+    parser.add_argument("--max-memory-mb", type=float, default=None, help="ignore settings above this peak memory")
+    parser.add_argument("--dry-run", action="store_true", help="only write the report, not pytorch_config.yaml")
+    args = parser.parse_args()
+
+    config_path = args.config or input("Enter full path to your DLC config.yaml: ").strip().strip('"')
+    if not Path(config_path).exists():
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+    train_folder = find_train_folder(config_path, shuffle=args.shuffle)
+    if train_folder is None:
+        raise FileNotFoundError("❌ No training folder found — create the training dataset first.")
+
+    grid = {k: v for k, v in (("batch_sizes", args.batch_sizes), ("dataloader_workers", args.workers),
+                              ("torch_threads", args.threads)) if v}
+    run_autotune(config_path, train_folder, shuffle=args.shuffle, grid=grid, timed_steps=args.steps,
+                 max_memory_mb=args.max_memory_mb, write=not args.dry_run)
+
+
+if __name__ == "__main__":
+    main()
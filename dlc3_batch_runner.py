@@ -0,0 +1,417 @@
+# FILE: dlc3_batch_runner.py
+# Purpose: Run the DLC3 pipeline headless for many projects from one YAML/JSON job spec.
+# Version: v1, no input() prompts, resumable per project, writes a machine-readable summary.
+#
+# Example job spec (YAML):
+#
+#   max_workers: 2                 # projects processed concurrently (one process per job)
+#   summary: batch_summary.json    # relative to the spec file
+#   defaults:                      # options shared by every project
+#     shuffle: 1
+#     iteration: 0                 # create_dataset rebuilds and switches config.yaml to it
+#   projects:
+#     - name: Feb
+#       config: C:/Users/thomas/users/2P_Feb_Social/Feb-Thomas-2025-10-03/config.yaml
+#       stages: [register_videos, extract_frames, create_dataset, train]
+#       options:
+#         video_root: C:/Users/thomas/users/2P_Feb_Social/Feb2025_behav
+#         exclude: MiceVideo1
+#         epochs: 500
+#         save_epochs: 50
+
+import argparse
+import contextlib
+import json
+import multiprocessing as mp
+import os
+import re
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+STATE_FILENAME = ".dlc3_batch_state.json"  # older per-project state file, only read as a fallback
+LOG_DIRNAME = "batch_logs"
+
+
+# ===================================================================
+# STAGES
+# ===================================================================
+# Every stage is called as stage(config_path, options, state) and returns a
+# JSON-serializable dict that is stored in the job's state file.
+
+def stage_register_videos(config_path, options, state):
+    """
+    Appends videos under options['video_root'] that are not yet in video_sets.
+    Fails without registering anything while a video is still being written (or cannot be read),
+    so the stage is not recorded as completed and the next run picks all of them up.
+    """
+    from dlc3_watch_videos import add_to_video_sets, find_unregistered_videos, probe_video
+
+    settle_seconds = options.get("settle_seconds", 30)
+    candidates = find_unregistered_videos(config_path, options["video_root"])
+
+    def signature(video):
+        try:
+            st = os.stat(video)
+        except OSError:  # moved or deleted meanwhile
+            return None
+        return st.st_size, st.st_mtime_ns
+
+    before = {video: signature(video) for video in candidates}
+    if candidates:
+        time.sleep(min(settle_seconds, 5))  # a copy in progress changes size in between
+    cutoff = (time.time() - settle_seconds) * 1e9
+    unsettled = [video for video in candidates
+                 if before[video] is None or signature(video) != before[video] or before[video][1] > cutoff]
+    if unsettled:
+        raise RuntimeError(f"{len(unsettled)} video(s) are still being written, re-run later: {unsettled}")
+
+    new_videos = {video: probe_video(video) for video in candidates}
+    unreadable = [video for video, crop in new_videos.items() if crop is None]
+    if unreadable:
+        raise RuntimeError(f"{len(unreadable)} video(s) cannot be read: {unreadable}")
+
+    added = add_to_video_sets(config_path, new_videos)
+    print(f"🔧 Registered {len(added)} new video(s).")
+    return {"added": added}
+
+
+def stage_extract_frames(config_path, options, state):
+    """Extracts frames for options['videos'], or for the videos added by register_videos."""
+    from dlc3_watch_videos import extract_new_videos
+
+    videos = options.get("videos")
+    if videos is None:
+        videos = state["completed"].get("register_videos", {}).get("result", {}).get("added", [])
+    if not videos:
+        print("ℹ️ No videos to extract frames from.")
+        return {"videos": []}
+    writer_options = {k: options[k] for k in ("png_compression",) if k in options}
+    report = extract_new_videos(config_path, videos, **writer_options)
+    return {"videos": list(videos), "report": report}
+
+
+def stage_create_dataset(config_path, options, state):
+    """Syncs labeled videos into config.yaml and rebuilds the training dataset (dlc3_syncvideos_createdataset.py)."""
+    import dlc3_syncvideos_createdataset as sync
+
+    iteration = options.get("iteration")
+    if iteration is None:
+        # No explicit iteration: rebuild the one config.yaml currently names (what train_network will train)
+        with open(config_path, "r", encoding="utf-8") as f:
+            iteration = yaml.safe_load(f).get("iteration", 0)
+    videos = sync.find_labeled_videos(config_path, options["video_root"])
+    if not videos:
+        raise RuntimeError("No matching video files found for the labeled folders.")
+    added = sync.update_config_with_labeled_videos(config_path, videos, options.get("exclude", ""),
+                                                   options.get("training_fraction", 0.8))
+    sync.reset_iteration(config_path, iteration)
+    sync.create_dataset(config_path, iteration, shuffle=options.get("shuffle", 1))
+    return {"labeled_videos": added, "iteration": iteration}
+
+
+def stage_build_image_cache(config_path, options, state):
+    """Packs the training frames into the memory-mapped image cache (dlc3_image_cache.py)."""
+    from dlc3_image_cache import build_image_cache
+
+    cache_dir = build_image_cache(config_path)
+    return {"cache_dir": str(cache_dir)}
+
+
+def stage_autotune(config_path, options, state):
+    """Runs the CPU autotuner (dlc3_autotune.py) and writes the winner into pytorch_config.yaml."""
+    from dlc3_autotune import run_autotune
+    from dlc3_v5 import find_train_folder
+
+    shuffle = options.get("shuffle", 1)
+    train_folder = find_train_folder(config_path, shuffle)  # the iteration train_network trains (config.yaml)
+    if train_folder is None:
+        raise FileNotFoundError("No training folder found — run create_dataset first.")
+    report = run_autotune(config_path, train_folder, shuffle=shuffle, grid=options.get("autotune_grid"),
+                          max_memory_mb=options.get("autotune_max_memory_mb"))
+    return {"best": report["best"]}
+
+
+def stage_train(config_path, options, state):
+    """Trains up to options['epochs'] in total, resuming from the latest snapshot of an interrupted run."""
+    from dlc3_v5 import find_snapshots, find_train_folder, launch_training, lower_learning_rate_for_resume
+
+    total_epochs = options["epochs"]
+    save_interval = options.get("save_epochs", 50)
+    shuffle = options.get("shuffle", 1)
+    precision = options.get("snapshot_precision")  # "fp16"/"bf16": compress older retained snapshots
+
+    train_folder = find_train_folder(config_path, shuffle)  # the iteration train_network trains (config.yaml)
+    snapshots = find_snapshots(str(train_folder)) if train_folder and options.get("resume", True) else {}
+    if not snapshots:
+        print(f"🚀 Starting a fresh training run ({total_epochs} epochs).")
+        launch_training(config_path, total_epochs, save_interval, shuffle=shuffle, snapshot_precision=precision)
+        return {"epochs": total_epochs, "resumed_from": None}
+
+    resume_epoch = max(snapshots)
+    if resume_epoch >= total_epochs:
+        print(f"✅ Snapshot for epoch {resume_epoch} already reaches the target of {total_epochs} epochs.")
+        return {"epochs": resume_epoch, "resumed_from": resume_epoch}
+
+    print(f"▶️ Resuming from epoch {resume_epoch} up to {total_epochs}.")
+    lower_learning_rate_for_resume(train_folder / "pytorch_config.yaml")
+    launch_training(config_path, total_epochs, save_interval, snapshot_path=snapshots[resume_epoch], shuffle=shuffle,
+                    snapshot_precision=precision)
+    return {"epochs": total_epochs, "resumed_from": resume_epoch}
+
+
+def stage_evaluate(config_path, options, state):
+    """Runs deeplabcut.evaluate_network for the configured shuffle."""
+    import deeplabcut
+
+    deeplabcut.evaluate_network(str(config_path), Shuffles=[options.get("shuffle", 1)])
+    return {}
+
+
+def stage_evaluate_snapshots(config_path, options, state):
+    """Evaluates every snapshot on the once-decoded test set (dlc3_eval_sweep.py)."""
+    from dlc3_eval_sweep import run_sweep
+    from dlc3_v5 import find_train_folder
+
+    shuffle = options.get("shuffle", 1)
+    train_folder = find_train_folder(config_path, shuffle)  # the iteration DLCLoader reads (config.yaml)
+    if train_folder is None:
+        raise FileNotFoundError("No training folder found — run create_dataset and train first.")
+    table = run_sweep(config_path, train_folder, shuffle=shuffle, workers=options.get("sweep_workers", 1),
+                      batch_size=options.get("sweep_batch_size", 16))
+    scored = [row for row in table.values() if row.get("rmse") not in ("", None)]
+    lowest = min(scored, key=lambda row: float(row["rmse"])) if scored else None
+    return {"snapshots": len(table), "lowest_rmse": lowest}
+
+
+def stage_analyze(config_path, options, state):
+    """Analyzes options['analyze_videos'] (default: all of video_sets) with dlc3_analyze.py."""
+    from dlc3_analyze import analyze_videos
+
+    results = analyze_videos(
+        config_path,
+        options.get("analyze_videos"),
+        shuffle=options.get("shuffle", 1),
+        snapshot=options.get("snapshot", "best"),
+        batch_size=options.get("analyze_batch_size", 16),
+        destfolder=options.get("destfolder"),
+    )
+    return {"outputs": [str(p) for p in results]}
+
+
+STAGES = {
+    "register_videos": stage_register_videos,
+    "extract_frames": stage_extract_frames,
+    "create_dataset": stage_create_dataset,
+    "build_image_cache": stage_build_image_cache,
+    "autotune": stage_autotune,
+    "train": stage_train,
+    "evaluate": stage_evaluate,
+    "evaluate_snapshots": stage_evaluate_snapshots,
+    "analyze": stage_analyze,
+}
+
+
+# ===================================================================
+# PROJECT STATE
+# ===================================================================
+
+def state_path_for(job):
+    """Per-job state file in the project, e.g. .dlc3_batch_state.Feb-shuffle1.json."""
+    key = re.sub(r"[^\w.-]+", "_", f"{job['name']}-shuffle{job['options'].get('shuffle', 1)}")
+    return Path(job["config"]).resolve().parent / f".dlc3_batch_state.{key}.json"
+
+
+def load_state(job):
+    state_path = state_path_for(job)
+    legacy_path = state_path.with_name(STATE_FILENAME)
+    if not state_path.exists() and job.get("sole_job_for_config") and legacy_path.exists():
+        state_path = legacy_path  # progress recorded by an older version (one state file per project)
+    if state_path.exists():
+        with open(state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return {"completed": {}}
+
+
+def save_state(job, state):
+    """Writes the job's state file atomically so a crash never leaves it half-written."""
+    state_path = state_path_for(job)
+    tmp_path = state_path.with_name(state_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, state_path)
+
+
+# ===================================================================
+# RUNNER
+# ===================================================================
+
+def run_project(job):
+    """Runs the stages of one project in order. Executed in a worker process."""
+    config_path = Path(job["config"]).resolve()
+    project_path = config_path.parent
+    summary = {
+        "name": job["name"],
+        "config": str(config_path),
+        "status": "ok",
+        "skipped_stages": [],
+        "completed_stages": [],
+        "failed_stage": None,
+        "error": None,
+    }
+    started = time.time()
+
+    log_dir = project_path / LOG_DIRNAME
+    log_dir.mkdir(exist_ok=True)
+    log_path = log_dir / f"batch_{datetime.now():%Y%m%d_%H%M%S}.log"
+    summary["log"] = str(log_path)
+
+    state = {"completed": {}} if job.get("restart") else load_state(job)
+
+    with open(log_path, "w", encoding="utf-8") as log, \
+            contextlib.redirect_stdout(log), contextlib.redirect_stderr(log):
+        print(f"🐭 Batch run for {job['name']} ({config_path})")
+        for stage in job["stages"]:
+            if stage in state["completed"]:
+                print(f"⏭ Skipping '{stage}' (completed {state['completed'][stage]['finished']}).")
+                summary["skipped_stages"].append(stage)
+                continue
+
+            print(f"\n▶️ Stage '{stage}'")
+            stage_start = time.time()
+            try:
+                result = STAGES[stage](config_path, job["options"], state)
+            except Exception as e:
+                traceback.print_exc()
+                summary.update(status="failed", failed_stage=stage, error=f"{type(e).__name__}: {e}")
+                state["failed"] = {"stage": stage, "error": summary["error"], "at": datetime.now().isoformat()}
+                save_state(job, state)
+                break
+
+            state["completed"][stage] = {
+                "finished": datetime.now().isoformat(timespec="seconds"),
+                "seconds": round(time.time() - stage_start, 1),
+                "result": result or {},
+            }
+            state.pop("failed", None)
+            save_state(job, state)
+            summary["completed_stages"].append(stage)
+            print(f"✅ Stage '{stage}' done in {state['completed'][stage]['seconds']} s.")
+
+    summary["seconds"] = round(time.time() - started, 1)
+    return summary
+
+
+def run_project_in_fresh_process(job):
+    """
+    Runs one project in a new process, so nothing a project sets up (environment variables, the
+    cv2.imread cache hook, torch thread count) carries over into the next project.
+    """
+    with ProcessPoolExecutor(max_workers=1, mp_context=mp.get_context("spawn")) as pool:
+        return pool.submit(run_project, job).result()
+
+
+def run_jobs_in_order(jobs):
+    """Runs jobs that share one project (config.yaml, training datasets) one after the other."""
+    results = []
+    for job in jobs:
+        try:
+            results.append(run_project_in_fresh_process(job))
+        except Exception as e:  # worker process died
+            results.append({"name": job["name"], "config": job["config"], "status": "failed",
+                            "failed_stage": None, "error": f"{type(e).__name__}: {e}"})
+    return results
+
+
+def load_job_spec(spec_path):
+    """Loads a YAML or JSON job spec and expands it into one job dict per project."""
+    spec_path = Path(spec_path)
+    with open(spec_path, "r", encoding="utf-8") as f:
+        spec = json.load(f) if spec_path.suffix.lower() == ".json" else yaml.safe_load(f)
+
+    defaults = spec.get("defaults", {})
+    jobs = []
+    for i, project in enumerate(spec.get("projects", [])):
+        if "config" not in project:
+            raise ValueError(f"❌ Project #{i + 1} in {spec_path} has no 'config' entry.")
+        stages = project.get("stages", spec.get("stages", []))
+        unknown = [s for s in stages if s not in STAGES]
+        if unknown:
+            raise ValueError(f"❌ Unknown stage(s) {unknown} for project #{i + 1}. Available: {list(STAGES)}")
+        jobs.append({
+            "name": project.get("name", Path(project["config"]).parent.name),
+            "config": str(spec_path.parent / project["config"]),  # relative paths are relative to the spec
+            "stages": stages,
+            "options": {**defaults, **project.get("options", {})},
+        })
+
+    names = [job["name"] for job in jobs]
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        # The name keys the job's progress file; entries for the same project need distinct names
+        raise ValueError(f"❌ Duplicate project name(s) {duplicates} in {spec_path} — give each entry a unique 'name'.")
+    return spec, jobs
+
+
+def run_batch(spec_path, max_workers=None, restart=False):
+    """Runs all projects of a job spec each in its own fresh process and writes the summary file."""
+    spec_path = Path(spec_path).resolve()
+    spec, jobs = load_job_spec(spec_path)
+    max_workers = max_workers or spec.get("max_workers") or 1
+    summary_path = spec_path.parent / spec.get("summary", "batch_summary.json")
+
+    groups = {}
+    for job in jobs:
+        job["restart"] = restart
+        if not Path(job["config"]).exists():
+            raise FileNotFoundError(f"❌ Config file not found: {job['config']}")
+        groups.setdefault(os.path.normcase(str(Path(job["config"]).resolve())), []).append(job)
+    for group in groups.values():
+        for job in group:
+            job["sole_job_for_config"] = len(group) == 1
+
+    print(f"🐭 Running {len(jobs)} job(s) in {len(groups)} project(s) with {max_workers} worker(s)...")
+    started = datetime.now()
+    results = []
+    # max_workers threads, each starting one fresh process per job (max_tasks_per_child needs Python 3.11);
+    # jobs for the same project run one after the other
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        futures = [pool.submit(run_jobs_in_order, group) for group in groups.values()]
+        for future in as_completed(futures):
+            for result in future.result():
+                results.append(result)
+                icon = "✅" if result["status"] == "ok" else "❌"
+                detail = f" at '{result['failed_stage']}': {result['error']}" if result["status"] != "ok" else ""
+                print(f"{icon} {result['name']}{detail}")
+
+    summary = {
+        "spec": str(spec_path),
+        "started": started.isoformat(timespec="seconds"),
+        "finished": datetime.now().isoformat(timespec="seconds"),
+        "ok": sum(r["status"] == "ok" for r in results),
+        "failed": sum(r["status"] != "ok" for r in results),
+        "projects": sorted(results, key=lambda r: r["name"]),
+    }
+    with open(summary_path, "w", encoding="utf-8") as f:
+        json.dump(summary, f, indent=2)
+    print(f"\n📄 Summary written to {summary_path} ({summary['ok']} ok, {summary['failed']} failed).")
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the DLC3 pipeline headless from a YAML/JSON job spec.")
+    parser.add_argument("spec", help="path to the job spec (.yaml, .yml or .json)")
+    parser.add_argument("--workers", type=int, default=None, help="number of projects processed concurrently")
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and run all stages again")
+    args = parser.parse_args()
+
+    summary = run_batch(args.spec, max_workers=args.workers, restart=args.restart)
+    raise SystemExit(1 if summary["failed"] else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,255 @@
+# FILE: dlc3_eval_sweep.py
+# Purpose: Evaluate every snapshot of a training run against a test set that is decoded only once.
+# Version: v1, sequential or parallel sweep, incremental metric table read by dlc3_v5.py's resume menu.
+#
+# deeplabcut.evaluate_network re-reads and re-decodes the full test set for every snapshot. Here the
+# test images are decoded once (from the image cache of dlc3_image_cache.py when available), kept in
+# memory and fed to each snapshot's inference runner. Results go to snapshot_evaluation.csv in the
+# train folder; snapshots already in the table are not evaluated again.
+
+import argparse
+import csv
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+TABLE_FILENAME = "snapshot_evaluation.csv"
+TABLE_COLUMNS = ["epoch", "snapshot", "best", "rmse", "rmse_pcutoff", "mAP", "mAR", "seconds", "mtime"]
+
+
+# ===================================================================
+# METRIC TABLE
+# ===================================================================
+
+def load_sweep_table(train_folder):
+    """Returns {snapshot file name: row dict} from snapshot_evaluation.csv (empty if there is none)."""
+    table_path = Path(train_folder) / TABLE_FILENAME
+    if not table_path.exists():
+        return {}
+    with open(table_path, "r", newline="", encoding="utf-8") as f:
+        return {row["snapshot"]: row for row in csv.DictReader(f)}
+
+
+def save_sweep_table(train_folder, rows):
+    table_path = Path(train_folder) / TABLE_FILENAME
+    tmp_path = table_path.with_name(TABLE_FILENAME + ".tmp")
+    with open(tmp_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=TABLE_COLUMNS, extrasaction="ignore")
+        writer.writeheader()
+        for row in sorted(rows.values(), key=lambda r: (int(r["epoch"]), r["best"] == "True")):
+            writer.writerow(row)
+    os.replace(tmp_path, table_path)
+
+
+def format_metric(row, key, spec=".2f"):
+    try:
+        return format(float(row[key]), spec)
+    except (KeyError, TypeError, ValueError):
+        return "-"
+
+
+# ===================================================================
+# TEST SET (decoded once)
+# ===================================================================
+
+def load_test_set(config_path, shuffle, workers=None):
+    """Returns (image paths, RGB images, ground truth dict) of the shuffle's test split."""
+    from deeplabcut.pose_estimation_pytorch.data import DLCLoader
+    from dlc3_image_cache import ImageCache, cache_dir_for
+
+    loader = DLCLoader(config=str(config_path), shuffle=shuffle, trainset_index=0)
+    ground_truth = loader.ground_truth_keypoints(mode="test")
+    paths = list(ground_truth)
+    cache = ImageCache.open(cache_dir_for(config_path))
+    if cache is not None and cache.is_stale():
+        cache = None
+
+    def decode(path):
+        if cache is not None and path in cache:
+            image = cache.get(path)
+        else:
+            image = cv2.imread(str(path))
+            if image is None:
+                raise IOError(f"❌ Could not decode test image: {path}")
+        return cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+
+    start = time.time()
+    with ThreadPoolExecutor(max_workers=workers or min(8, os.cpu_count() or 1)) as pool:
+        images = list(pool.map(decode, paths))
+    source = "image cache" if cache is not None else "disk"
+    print(f"🗂 Decoded {len(images)} test images once from {source} in {time.time() - start:.1f} s "
+          f"({sum(i.nbytes for i in images) / 1e6:.0f} MB in memory).")
+    return paths, images, ground_truth
+
+
+def _rmse_metrics(ground_truth, predictions, pcutoff):
+    """Fallback RMSE (single animal) if DLC's metric API is not available."""
+    errors, errors_cut = [], []
+    for path, gt in ground_truth.items():
+        gt = np.asarray(gt)[0]
+        pred = np.asarray(predictions[path])[0]
+        visible = gt[:, 2] > 0
+        distances = np.linalg.norm(gt[visible, :2] - pred[visible, :2], axis=1)
+        errors.extend(distances)
+        errors_cut.extend(distances[pred[visible, 2] >= pcutoff])
+    return {
+        "rmse": float(np.nanmean(errors)) if errors else np.nan,
+        "rmse_pcutoff": float(np.nanmean(errors_cut)) if errors_cut else np.nan,
+    }
+
+
+def compute_snapshot_metrics(ground_truth, predictions, single_animal, pcutoff):
+    try:
+        from deeplabcut.core.metrics import compute_metrics
+    except ImportError:
+        return _rmse_metrics(ground_truth, predictions, pcutoff)
+    return compute_metrics(ground_truth, predictions, single_animal=single_animal, pcutoff=pcutoff)
+
+
+# ===================================================================
+# EVALUATION (one snapshot)
+# ===================================================================
+
+_TEST_SET = {}
+
+
+def _init_worker(test_set, threads):
+    """Process-pool initializer: receives the decoded test set once per worker process."""
+    _TEST_SET.update(test_set)
+    if threads:
+        import torch
+        torch.set_num_threads(threads)
+
+
+def evaluate_snapshot(snapshot_path, model_cfg, batch_size, device, pcutoff, test_set=None):
+    """Runs one snapshot over the in-memory test set and returns its metric row."""
+    from dlc3_analyze import build_pose_runner
+    from dlc3_v5 import loadable_snapshot
+
+    test_set = test_set or _TEST_SET
+    start = time.time()
+    with loadable_snapshot(snapshot_path) as weights_path:  # compressed snapshots: temporary fp32 copy
+        pose_runner = build_pose_runner(model_cfg, weights_path, batch_size, device)
+    outputs = pose_runner.inference(test_set["images"])
+    predictions = {path: out["bodyparts"] for path, out in zip(test_set["paths"], outputs)}
+    single_animal = len(model_cfg["metadata"].get("individuals") or []) <= 1
+    metrics = compute_snapshot_metrics(test_set["ground_truth"], predictions, single_animal, pcutoff)
+
+    name = Path(snapshot_path).name
+    return {
+        "epoch": int(Path(snapshot_path).stem.split("-")[-1]),
+        "snapshot": name,
+        "best": str(name.startswith("snapshot-best-")),
+        **{k: float(metrics[k]) if k in metrics else "" for k in ("rmse", "rmse_pcutoff", "mAP", "mAR")},
+        "seconds": round(time.time() - start, 1),
+        "mtime": int(os.path.getmtime(snapshot_path)),
+    }
+
+
+# ===================================================================
+# SWEEP
+# ===================================================================
+
+def run_sweep(config_path, train_folder, shuffle=None, workers=1, batch_size=16, device="cpu", force=False):
+    """
+    Evaluates all snapshots of the train folder that are not yet (or no longer up to date) in the
+    metric table. workers > 1 evaluates snapshots in parallel processes that share the CPU cores.
+    Returns the full table {snapshot name: row}. The shuffle defaults to the one in the folder name.
+    """
+    from dlc3_v5 import find_snapshots
+
+    train_folder = Path(train_folder)
+    if shuffle is None:
+        match = re.search(r"shuffle(\d+)$", train_folder.parent.name)
+        shuffle = int(match.group(1)) if match else 1
+    with open(Path(config_path), "r", encoding="utf-8") as f:
+        pcutoff = yaml.safe_load(f).get("pcutoff", 0.6)
+    with open(train_folder / "pytorch_config.yaml", "r") as f:
+        model_cfg = yaml.safe_load(f)
+    if str(model_cfg.get("method", "bu")).lower() == "td":
+        # The bottom-up runner used here would see whole images without detector crops -> wrong metrics
+        raise ValueError("❌ Top-down model: the snapshot sweep only supports bottom-up models. Set "
+                         "snapshotindex: all in config.yaml and use deeplabcut.evaluate_network instead.")
+
+    snapshot_paths = list(find_snapshots(str(train_folder)).values()) + sorted(train_folder.glob("snapshot-best-*.pt"))
+    table = {} if force else load_sweep_table(train_folder)
+    table = {name: row for name, row in table.items() if (train_folder / name).exists()}
+    todo = [Path(p) for p in snapshot_paths
+            if Path(p).name not in table or int(table[Path(p).name]["mtime"]) != int(os.path.getmtime(p))]
+    if not todo:
+        print("✅ All snapshots are already evaluated.")
+        return table
+
+    print(f"\n📏 Evaluating {len(todo)} snapshot(s) ({len(table)} already in {TABLE_FILENAME})...")
+    paths, images, ground_truth = load_test_set(config_path, shuffle)
+    test_set = {"paths": paths, "images": images, "ground_truth": ground_truth}
+
+    def record(row):
+        table[row["snapshot"]] = row
+        save_sweep_table(train_folder, table)  # keep what is done if the sweep is interrupted
+        print(f"   epoch {row['epoch']:>4}{' (best)' if row['best'] == 'True' else ''}: "
+              f"RMSE {format_metric(row, 'rmse')} px, RMSE@pcutoff {format_metric(row, 'rmse_pcutoff')} px, "
+              f"mAP {format_metric(row, 'mAP')}  [{row['seconds']} s]")
+
+    if workers <= 1:
+        for snapshot_path in todo:
+            record(evaluate_snapshot(snapshot_path, model_cfg, batch_size, device, pcutoff, test_set))
+    else:
+        threads = max((os.cpu_count() or 1) // workers, 1)
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(test_set, threads)) as pool:
+            futures = [pool.submit(evaluate_snapshot, str(p), model_cfg, batch_size, device, pcutoff)
+                       for p in todo]
+            for future in futures:
+                record(future.result())
+
+    print(f"📄 Metric table written to {train_folder / TABLE_FILENAME}")
+    return table
+
+
+def print_sweep_table(table):
+    """Prints the metric table sorted by epoch and points out the best epochs."""
+    rows = sorted(table.values(), key=lambda r: int(r["epoch"]))
+    print("\n--- Snapshot evaluation (test set) ---")
+    print(f"  {'Epoch':>6}  {'RMSE':>8}  {'RMSE@p':>8}  {'mAP':>7}")
+    for row in rows:
+        flag = "  ← best (training)" if row["best"] == "True" else ""
+        print(f"  {row['epoch']:>6}  {format_metric(row, 'rmse'):>8}  {format_metric(row, 'rmse_pcutoff'):>8}"
+              f"  {format_metric(row, 'mAP'):>7}{flag}")
+    scored = [r for r in rows if format_metric(r, "rmse") != "-"]
+    if scored:
+        lowest = min(scored, key=lambda r: float(r["rmse"]))
+        print(f"  Lowest test RMSE: epoch {lowest['epoch']} ({format_metric(lowest, 'rmse')} px)")
+
+
+def main():
+    from dlc3_v5 import find_train_folder
+
+    parser = argparse.ArgumentParser(description="Evaluate all snapshots of a DLC3 training run.")
+    parser.add_argument("config", nargs="?", help="path to the project's config.yaml")
+    parser.add_argument("--shuffle", type=int, default=1)
+    parser.add_argument("--workers", type=int, default=1, help="snapshots evaluated in parallel (default 1)")
+    parser.add_argument("--batch-size", type=int, default=16)
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--force", action="store_true", help="re-evaluate snapshots already in the table")
+    args = parser.parse_args()
+
+    config_path = args.config or input("Enter full path to your DLC config.yaml: ").strip().strip('"')
+    if not Path(config_path).exists():
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+    train_folder = find_train_folder(config_path, shuffle=args.shuffle)
+    if train_folder is None:
+        raise FileNotFoundError(f"❌ No training folder found for shuffle {args.shuffle}.")
+    table = run_sweep(config_path, train_folder, shuffle=args.shuffle, workers=args.workers,
+                      batch_size=args.batch_size, device=args.device, force=args.force)
+    print_sweep_table(table)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,8 @@
-import deeplabcut
 from pathlib import Path
 import ruamel.yaml
 import cv2
 import shutil
+from dlc3_frame_writer import extract_frames_parallel
 
 # -----------------------------
 # CONFIG PATH
@@ -10,6 +10,12 @@ import shutil
 config_path = Path(r"C:\Users\thomas\users\2P_Feb_Social\Feb-Thomas-2025-10-03\config.yaml")
 backup_path = config_path.with_suffix(".yaml.bak")
 
+# -----------------------------
+# FRAME WRITER SETTINGS
+# -----------------------------
+PNG_COMPRESSION = 3       # 0 (fastest, largest) ... 9 (slowest, smallest)
+WRITER_THREADS = 4        # frames encoded/written in parallel
+
 # -----------------------------
 # USER INPUT: VIDEOS
 # -----------------------------
@@ -69,15 +75,19 @@ print(f"🔧 Updated config.yaml with {len(videos_to_add)} new videos ONLY.")
 # -----------------------------
 # RUN EXTRACTION
 # -----------------------------
-deeplabcut.extract_frames(
-    str(config_path),
-    mode="automatic",
-    algo="kmeans",   # or "uniform"
-    crop=False,
-    userfeedback=False,
+report = extract_frames_parallel(
+    config_path,
+    list(cfg["video_sets"]),
+    algo="kmeans",            # or "uniform"
     cluster_step=10,          # speed up extraction (downsample frames)
-    cluster_resizewidth=150   # smaller frames for kmeans
+    cluster_resizewidth=150,  # smaller frames for kmeans
+    png_compression=PNG_COMPRESSION,
+    workers=WRITER_THREADS,
 )
 
+total_mb = sum(r["bytes"] for r in report.values()) / 1e6
+total_s = sum(r["seconds"] for r in report.values())
+print(f"\n📊 Wrote {sum(r['frames'] for r in report.values())} frames, {total_mb:.1f} MB in {total_s:.1f} s.")
+
 print("\n✅ Done! You can now label the frames in the GUI.")
 print(f"⚠️ Remember: your old config.yaml is backed up at {backup_path}")
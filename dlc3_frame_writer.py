@@ -0,0 +1,134 @@
+# FILE: dlc3_frame_writer.py
+# Purpose: Frame extraction with DLC's frame selection but a parallel, configurable image writer.
+# Version: v1, thread-pool PNG writer with a selectable compression level.
+#
+# deeplabcut.extract_frames writes every selected frame synchronously as PNG with default compression.
+# Here frames are still picked by DLC (kmeans / uniform) but encoding + writing runs on a thread pool
+# (cv2.imwrite releases the GIL), and time and bytes written are reported per video.
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+
+class FrameWriter:
+    """
+    Encodes and writes frames as PNG on a thread pool.
+
+    At most `max_pending` frames are queued at once, so a fast reader cannot fill up memory.
+    Call close() to wait for all writes; it returns (files written, bytes written).
+    """
+
+    def __init__(self, png_compression=3, workers=None, max_pending=None):
+        self.params = [cv2.IMWRITE_PNG_COMPRESSION, int(png_compression)]
+        workers = workers or min(8, os.cpu_count() or 1)
+        self._pool = ThreadPoolExecutor(max_workers=workers)
+        self._slots = threading.BoundedSemaphore(max_pending or workers * 4)
+        self._lock = threading.Lock()
+        self._futures = []
+        self.files = 0
+        self.bytes = 0
+
+    def _write(self, path, frame):
+        try:
+            if not cv2.imwrite(str(path), frame, self.params):
+                raise IOError(f"❌ Could not write {path}")
+            size = os.path.getsize(path)
+            with self._lock:
+                self.files += 1
+                self.bytes += size
+        finally:
+            self._slots.release()
+
+    def submit(self, path, frame):
+        """Queues one BGR frame for writing (blocks while too many frames are pending)."""
+        self._slots.acquire()
+        self._futures.append(self._pool.submit(self._write, path, frame))
+
+    def close(self):
+        self._pool.shutdown(wait=True)
+        for future in self._futures:
+            future.result()  # re-raise write errors
+        return self.files, self.bytes
+
+
+def select_frames(video_path, numframes2pick, start, stop, algo="kmeans", cluster_step=10, cluster_resizewidth=150):
+    """Picks frame indices with DLC's own selection (same as deeplabcut.extract_frames, mode='automatic')."""
+    from deeplabcut.utils import frameselectiontools
+    from deeplabcut.utils.auxfun_videos import VideoWriter
+
+    cap = VideoWriter(str(video_path))
+    nframes = len(cap)
+    if algo == "uniform":
+        frames2pick = frameselectiontools.UniformFramescv2(cap, numframes2pick, start, stop)
+    elif algo == "kmeans":
+        frames2pick = frameselectiontools.KmeansbasedFrameselectioncv2(
+            cap, numframes2pick, start, stop, step=cluster_step, resizewidth=cluster_resizewidth,
+        )
+    else:
+        raise ValueError(f"❌ Unknown frame selection algorithm '{algo}'")
+    cap.close()
+    return nframes, sorted(int(i) for i in frames2pick)
+
+
+def extract_video(video_path, output_dir, frame_indices, nframes, writer):
+    """Reads the selected frames in order and hands them to the writer."""
+    output_dir.mkdir(parents=True, exist_ok=True)
+    indexlength = int(np.ceil(np.log10(max(nframes, 2))))
+    cap = cv2.VideoCapture(str(video_path))
+    position = 0
+    try:
+        for index in frame_indices:
+            if index != position:
+                if 0 < index - position <= 30:
+                    # Close frames: grabbing is cheaper (and more exact) than seeking
+                    for _ in range(index - position):
+                        cap.grab()
+                else:
+                    cap.set(cv2.CAP_PROP_POS_FRAMES, index)
+            ok, frame = cap.read()
+            position = index + 1
+            if not ok or frame is None:
+                print(f"⚠️ Could not read frame {index} of {Path(video_path).name}")
+                continue
+            writer.submit(output_dir / f"img{str(index).zfill(indexlength)}.png", frame)
+    finally:
+        cap.release()
+
+
+def extract_frames_parallel(config_path, videos, algo="kmeans", cluster_step=10, cluster_resizewidth=150,
+                            png_compression=3, workers=None):
+    """
+    Extracts frames into labeled-data/<video stem>/ like deeplabcut.extract_frames (automatic mode),
+    writing them as PNG on a thread pool (DLC and dlc3_image_cache.py only pick up img*.png frames).
+    Returns {video: {"frames", "bytes", "seconds"}}.
+    """
+    config_path = Path(config_path)
+    with open(config_path, "r", encoding="utf-8") as f:
+        cfg = yaml.safe_load(f)
+    numframes2pick = cfg.get("numframes2pick", 20)
+    start, stop = cfg.get("start", 0), cfg.get("stop", 1)
+
+    report = {}
+    for video in videos:
+        t0 = time.time()
+        nframes, indices = select_frames(video, numframes2pick, start, stop, algo, cluster_step, cluster_resizewidth)
+        t_select = time.time() - t0
+
+        writer = FrameWriter(png_compression, workers)
+        output_dir = config_path.parent / "labeled-data" / Path(video).stem
+        try:
+            extract_video(video, output_dir, indices, nframes, writer)
+        finally:
+            files, written = writer.close()
+        seconds = time.time() - t0
+        report[str(video)] = {"frames": files, "bytes": written, "seconds": round(seconds, 2)}
+        print(f"🖼 {Path(video).name}: {files} frames, {written / 1e6:.1f} MB in {seconds:.1f} s "
+              f"(selection {t_select:.1f} s, writing {seconds - t_select:.1f} s) → {output_dir}")
+    return report
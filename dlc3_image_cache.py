@@ -0,0 +1,262 @@
+# FILE: dlc3_image_cache.py
+# Purpose: Pack the labeled training frames into one pre-decoded, memory-mapped uint8 array.
+# Version: v1, built after deeplabcut.create_training_dataset, rebuilt automatically when labels change.
+#
+# Layout (inside training-datasets/iteration-N/image_cache/):
+#   images.u8   all decoded frames (BGR, as returned by cv2.imread) back to back
+#   index.json  fingerprint of the labeled data + {relative image path: offset, shape}
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+CACHE_DIRNAME = "image_cache"
+DATA_FILENAME = "images.u8"
+INDEX_FILENAME = "index.json"
+CACHE_VERSION = 1
+
+# Kept so that (re)building a cache always decodes from disk, even after install_imread_hook()
+_original_imread = cv2.imread
+
+
+def _rel_key(path, project_path):
+    """Key of an image in the index: its path relative to the project, with forward slashes."""
+    return Path(os.path.relpath(path, project_path)).as_posix()
+
+
+def cache_dir_for(config_path):
+    """Returns the cache folder of the iteration currently set in config.yaml."""
+    config_path = Path(config_path)
+    with open(config_path, "r", encoding="utf-8") as f:
+        iteration = yaml.safe_load(f).get("iteration", 0)
+    return config_path.parent / "training-datasets" / f"iteration-{iteration}" / CACHE_DIRNAME
+
+
+def find_training_images(project_path):
+    """Returns the img*.png frames of every labeled-data folder that has a CollectedData_*.h5 file."""
+    labeled_data_dir = Path(project_path) / "labeled-data"
+    images = []
+    for folder in sorted(p for p in labeled_data_dir.iterdir() if p.is_dir()):
+        if any(folder.glob("CollectedData_*.h5")):
+            images.extend(sorted(folder.glob("img*.png")))
+    return images
+
+
+def labeled_data_fingerprint(project_path):
+    """Hashes name, size and mtime of all training images and label files; changes whenever labels change."""
+    project_path = Path(project_path)
+    digest = hashlib.sha1()
+    labeled_data_dir = project_path / "labeled-data"
+    for folder in sorted(p for p in labeled_data_dir.iterdir() if p.is_dir()):
+        labels = sorted(folder.glob("CollectedData_*.h5"))
+        if not labels:
+            continue
+        for f in labels + sorted(folder.glob("img*.png")):
+            st = f.stat()
+            digest.update(f"{_rel_key(f, project_path)}|{st.st_size}|{st.st_mtime_ns}\n".encode())
+    return digest.hexdigest()
+
+
+def _decode(path):
+    image = _original_imread(str(path))
+    if image is None:
+        raise IOError(f"❌ Could not decode image: {path}")
+    return np.ascontiguousarray(image)
+
+
+def build_image_cache(config_path, workers=None, force=False):
+    """
+    Decodes all training images once and writes them into the cache folder of the current iteration.
+    Returns the cache folder. Nothing is rebuilt if the cache is up to date (unless force=True).
+    """
+    config_path = Path(config_path)
+    project_path = config_path.parent
+    cache_dir = cache_dir_for(config_path)
+    fingerprint = labeled_data_fingerprint(project_path)
+
+    if not force:
+        cache = ImageCache.open(cache_dir)
+        if cache is not None and cache.fingerprint == fingerprint:
+            print(f"✅ Image cache is up to date: {cache_dir}")
+            return cache_dir
+
+    images = find_training_images(project_path)
+    if not images:
+        raise FileNotFoundError(f"❌ No labeled training images found under {project_path / 'labeled-data'}")
+
+    print(f"\n🗜 Building image cache for {len(images)} training images...")
+    start = time.time()
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    data_path = cache_dir / DATA_FILENAME
+    tmp_data_path = data_path.with_name(DATA_FILENAME + ".tmp")
+
+    entries = {}
+    offset = 0
+    workers = workers or min(8, os.cpu_count() or 1)
+    # cv2 releases the GIL while decoding, so threads decode in parallel; map() keeps the order.
+    # Images are submitted in chunks so that only a few decoded frames are held in memory at a time.
+    chunk = workers * 4
+    with ThreadPoolExecutor(max_workers=workers) as pool, open(tmp_data_path, "wb") as f:
+        for i in range(0, len(images), chunk):
+            paths = images[i:i + chunk]
+            for path, image in zip(paths, pool.map(_decode, paths)):
+                f.write(image.data)
+                entries[_rel_key(path, project_path)] = {"offset": offset, "shape": list(image.shape)}
+                offset += image.nbytes
+
+    # The index is written last: a cache without a matching index is never used
+    index_path = cache_dir / INDEX_FILENAME
+    if index_path.exists():
+        index_path.unlink()
+    os.replace(tmp_data_path, data_path)
+    tmp_index_path = index_path.with_name(INDEX_FILENAME + ".tmp")
+    with open(tmp_index_path, "w", encoding="utf-8") as f:
+        json.dump({
+            "version": CACHE_VERSION,
+            "fingerprint": fingerprint,
+            "total_bytes": offset,
+            "entries": entries,
+        }, f)
+    os.replace(tmp_index_path, index_path)
+
+    print(f"✅ Image cache written: {offset / 1e6:.1f} MB in {time.time() - start:.1f} s → {cache_dir}")
+    return cache_dir
+
+
+class ImageCache:
+    """
+    Read access to a built image cache.
+
+    The memory map is opened lazily on first access, so every data-loader worker process maps the
+    file itself instead of receiving a pickled copy. get() returns read-only zero-copy views, so an
+    accidental in-place write raises instead of changing the cached frame for the rest of the run.
+    """
+
+    def __init__(self, cache_dir, index):
+        self.cache_dir = Path(os.path.abspath(cache_dir))  # keys must not depend on later chdir() calls
+        self.project_path = self.cache_dir.parents[2]
+        self.fingerprint = index["fingerprint"]
+        self.total_bytes = index["total_bytes"]
+        self.entries = index["entries"]
+        self._data = None
+
+    @classmethod
+    def open(cls, cache_dir):
+        """Returns the cache in cache_dir, or None if there is no complete cache."""
+        index_path = Path(cache_dir) / INDEX_FILENAME
+        if not index_path.exists() or not (Path(cache_dir) / DATA_FILENAME).exists():
+            return None
+        with open(index_path, "r", encoding="utf-8") as f:
+            index = json.load(f)
+        if index.get("version") != CACHE_VERSION or index.get("resize_width"):
+            return None  # other layout, or a pre-resized cache from an earlier version
+        return cls(cache_dir, index)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_data"] = None  # never pickle the mapping itself
+        return state
+
+    def __len__(self):
+        return len(self.entries)
+
+    def key(self, path):
+        # Relative paths are relative to the working directory, as for cv2.imread
+        return _rel_key(os.path.abspath(path), self.project_path)
+
+    def __contains__(self, path):
+        return self.key(path) in self.entries
+
+    def is_stale(self):
+        """True if the labeled data changed since the cache was built."""
+        return labeled_data_fingerprint(self.project_path) != self.fingerprint
+
+    def get(self, path):
+        """Returns the decoded BGR image of `path` as a read-only, zero-copy view into the cache."""
+        if self._data is None:
+            self._data = np.memmap(self.cache_dir / DATA_FILENAME, dtype=np.uint8, mode="r",
+                                   shape=(self.total_bytes,))
+        entry = self.entries[self.key(path)]
+        size = int(np.prod(entry["shape"]))
+        return np.asarray(self._data[entry["offset"]:entry["offset"] + size]).reshape(entry["shape"])
+
+
+def install_imread_hook(cache):
+    """
+    Serves cv2.imread() calls for cached frames from the memory map, in this process and in data-loader
+    workers forked from it.
+    """
+    if getattr(cv2.imread, "_dlc3_image_cache", None) is not None:
+        cv2.imread._dlc3_image_cache = cache
+        return True
+
+    def cached_imread(filename, flags=cv2.IMREAD_COLOR):
+        active = cached_imread._dlc3_image_cache
+        if flags == cv2.IMREAD_COLOR:
+            try:
+                if filename in active:
+                    # Like the real imread, hand out a fresh writable array (a memcpy, not a PNG decode)
+                    return active.get(filename).copy()
+            except ValueError:  # path on another drive than the project (Windows relpath)
+                pass
+        return _original_imread(filename, flags)
+
+    cached_imread._dlc3_image_cache = cache
+    cv2.imread = cached_imread
+    return True
+
+
+def refresh_image_cache(config_path):
+    """Rebuilds the cache of the current iteration if the labeled frames changed. Returns it (or None)."""
+    cache_dir = cache_dir_for(config_path)
+    cache = ImageCache.open(cache_dir)
+    if cache is not None and cache.is_stale():
+        print("♻️ Labeled frames changed since the image cache was built — rebuilding it.")
+        build_image_cache(config_path, force=True)
+        cache = ImageCache.open(cache_dir)
+    return cache
+
+
+def prepare_image_cache_for_training(config_path, rebuild=True):
+    """
+    Called before training: if a cache exists for the current iteration, rebuild it when the labeled
+    frames changed, then install the cv2.imread hook. Does nothing for projects without a cache.
+    With rebuild=False (another process owns the cache) a stale cache is simply not used.
+    """
+    if rebuild:
+        cache = refresh_image_cache(config_path)
+    else:
+        cache = ImageCache.open(cache_dir_for(config_path))
+        if cache is not None and cache.is_stale():
+            print("⚠️ Image cache is out of date — reading the PNG frames instead.")
+            return None
+    if cache is None:
+        return None
+    if install_imread_hook(cache):
+        print(f"🗜 Serving {len(cache)} training images from the image cache.")
+    return cache
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build the pre-decoded image cache for a DLC project.")
+    parser.add_argument("config", nargs="?", help="path to the project's config.yaml")
+    parser.add_argument("--workers", type=int, default=None, help="decode threads (default: up to 8)")
+    parser.add_argument("--force", action="store_true", help="rebuild even if the cache is up to date")
+    args = parser.parse_args()
+
+    config_path = args.config or input("Enter full path to your DLC config.yaml: ").strip().strip('"')
+    if not Path(config_path).exists():
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+    build_image_cache(config_path, workers=args.workers, force=args.force)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,382 @@
+# FILE: dlc3_monitor.py
+# Purpose: Live view of one or many DLC3 training runs without re-reading learning_stats.csv every time.
+# Version: v1, tails learning_stats.csv from a saved byte offset, prints a status line or serves JSON.
+
+import argparse
+import csv
+import json
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import yaml
+
+STATS_FILENAME = "learning_stats.csv"
+STATE_FILENAME = ".monitor_state.json"
+SNAPSHOT_RE = re.compile(r"snapshot-(best-)?(\d+)\.pt$")
+
+
+class RunMonitor:
+    """
+    Incremental view of one training run (one `train` folder).
+
+    Only the bytes appended to learning_stats.csv since the last poll are read; the byte offset and the
+    latest values (loss EMA, metrics) are saved in .monitor_state.json so a restarted monitor continues
+    where it stopped. The epochs/hour window is not saved: samples from an earlier session would span the
+    pause in between and understate the rate.
+    The snapshot folder is only re-listed when its mtime changes; the state file therefore lives one level
+    up (next to `train` and `test`), where writing it does not touch the train folder's mtime.
+    """
+
+    def __init__(self, train_folder, max_epochs=None, ema_alpha=0.1, rate_window=50):
+        self.train_folder = Path(train_folder)
+        self.stats_path = self.train_folder / STATS_FILENAME
+        self.state_path = self.train_folder.parent / STATE_FILENAME
+        self.max_epochs_override = max_epochs
+        self.ema_alpha = ema_alpha
+        self.rate_window = rate_window
+
+        self.offset = 0
+        self.header = None
+        self.epoch = None
+        self.loss = None
+        self.loss_ema = None
+        self.eval_loss = None
+        self.metrics = {}
+        self.samples = deque(maxlen=rate_window)  # (wall time, epoch) of observed rows
+        self.last_update = None
+
+        self._config_mtime = None
+        self._max_epochs = None
+        self._snapshot_dir_mtime = None
+        self.snapshots = []    # sorted epochs of regular snapshots
+        self.best_snapshot = None
+        self._load_state()
+
+    # --- persistence ------------------------------------------------
+
+    def _load_state(self):
+        if not self.state_path.exists():
+            return
+        try:
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return
+        self.offset = state.get("offset", 0)
+        self.header = state.get("header")
+        self.epoch = state.get("epoch")
+        self.loss = state.get("loss")
+        self.loss_ema = state.get("loss_ema")
+        self.eval_loss = state.get("eval_loss")
+        self.metrics = state.get("metrics", {})
+        self.last_update = state.get("last_update")
+
+    def _save_state(self):
+        state = {
+            "offset": self.offset,
+            "header": self.header,
+            "epoch": self.epoch,
+            "loss": self.loss,
+            "loss_ema": self.loss_ema,
+            "eval_loss": self.eval_loss,
+            "metrics": self.metrics,
+            "last_update": self.last_update,
+        }
+        tmp_path = self.state_path.with_name(STATE_FILENAME + ".tmp")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.state_path)
+        except OSError:
+            pass  # read-only run folder: keep going with in-memory state
+
+    def _reset(self):
+        self.offset = 0
+        self.header = None
+        self.epoch = self.loss = self.loss_ema = self.eval_loss = None
+        self.metrics = {}
+        self.samples.clear()
+
+    # --- polling ----------------------------------------------------
+
+    def _read_new_rows(self):
+        """Returns the complete CSV rows appended since the last call."""
+        try:
+            size = os.path.getsize(self.stats_path)
+        except OSError:
+            return []
+        if size == self.offset:
+            return []
+
+        with open(self.stats_path, "rb") as f:
+            if size < self.offset or (self.header is not None and
+                                      next(csv.reader([f.readline().decode("utf-8", errors="replace")]), None)
+                                      != self.header):
+                # File was rewritten (e.g. a resumed run merged its logs) -> start over
+                self._reset()
+            f.seek(self.offset)
+            chunk = f.read(size - self.offset)
+        end = chunk.rfind(b"\n")
+        if end < 0:
+            return []  # only a partially written line so far
+        self.offset += end + 1
+        lines = chunk[:end + 1].decode("utf-8", errors="replace").splitlines()
+
+        if self.header is None and lines:
+            self.header = next(csv.reader([lines[0]]))
+            lines = lines[1:]
+        return [dict(zip(self.header, row)) for row in csv.reader(lines) if row]
+
+    @staticmethod
+    def _number(value):
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            return None
+        return None if math.isnan(number) else number
+
+    def _ingest(self, rows, now):
+        for row in rows:
+            epoch = self._number(row.get("step", next(iter(row.values()), None)))
+            if epoch is None:
+                continue
+            self.epoch = int(epoch)
+            loss = self._number(row.get("losses/train.total_loss"))
+            if loss is not None:
+                self.loss = loss
+                self.loss_ema = loss if self.loss_ema is None else \
+                    self.ema_alpha * loss + (1 - self.ema_alpha) * self.loss_ema
+            eval_loss = self._number(row.get("losses/eval.total_loss"))
+            if eval_loss is not None:
+                self.eval_loss = eval_loss
+            for key, value in row.items():
+                if key.startswith("metrics/"):
+                    number = self._number(value)
+                    if number is not None:
+                        self.metrics[key[len("metrics/"):]] = number
+        if rows and self.epoch is not None:
+            self.samples.append((now, self.epoch))
+            self.last_update = now
+
+    def _poll_snapshots(self):
+        try:
+            mtime = os.stat(self.train_folder).st_mtime_ns
+        except OSError:
+            return
+        if mtime == self._snapshot_dir_mtime:
+            return
+        self._snapshot_dir_mtime = mtime
+        regular, best = [], None
+        with os.scandir(self.train_folder) as it:
+            for entry in it:
+                match = SNAPSHOT_RE.search(entry.name)
+                if match:
+                    if match.group(1):
+                        best = int(match.group(2))
+                    else:
+                        regular.append(int(match.group(2)))
+        self.snapshots = sorted(regular)
+        self.best_snapshot = best
+
+    @property
+    def max_epochs(self):
+        """Target epochs: --max-epochs, else train_settings.epochs of pytorch_config.yaml (re-read on change)."""
+        if self.max_epochs_override:
+            return self.max_epochs_override
+        config_path = self.train_folder / "pytorch_config.yaml"
+        try:
+            mtime = os.stat(config_path).st_mtime_ns
+        except OSError:
+            return None
+        if mtime != self._config_mtime:
+            self._config_mtime = mtime
+            with open(config_path, "r") as f:
+                self._max_epochs = (yaml.safe_load(f) or {}).get("train_settings", {}).get("epochs")
+        return self._max_epochs
+
+    def poll(self):
+        """Reads whatever is new and returns the current status dict."""
+        now = time.time()
+        rows = self._read_new_rows()
+        if rows:
+            if not self.samples:
+                # First read of an existing file: date the backlog by the file's mtime
+                now = os.path.getmtime(self.stats_path)
+            self._ingest(rows, now)
+            self._save_state()
+        self._poll_snapshots()
+        return self.status()
+
+    def epochs_per_hour(self):
+        if len(self.samples) >= 2:
+            (t0, e0), (t1, e1) = self.samples[0], self.samples[-1]
+            if t1 > t0 and e1 > e0:
+                return (e1 - e0) / (t1 - t0) * 3600
+        return None
+
+    def status(self):
+        rate = self.epochs_per_hour()
+        max_epochs = self.max_epochs
+        eta_hours = None
+        if rate and max_epochs and self.epoch is not None:
+            eta_hours = max(max_epochs - self.epoch, 0) / rate
+        return {
+            "run": str(self.train_folder.parent.relative_to(self.train_folder.parents[2])),
+            "train_folder": str(self.train_folder),
+            "epoch": self.epoch,
+            "max_epochs": max_epochs,
+            "loss": self.loss,
+            "loss_ema": self.loss_ema,
+            "eval_loss": self.eval_loss,
+            "metrics": self.metrics,
+            "epochs_per_hour": round(rate, 2) if rate else None,
+            "eta_hours": round(eta_hours, 2) if eta_hours is not None else None,
+            "last_update_age_s": round(time.time() - self.last_update) if self.last_update else None,
+            "latest_snapshot": self.snapshots[-1] if self.snapshots else None,
+            "best_snapshot": self.best_snapshot,
+        }
+
+
+def format_status_line(s):
+    """One compact line per run, e.g. for a terminal refreshing every few seconds."""
+    def fmt(value, spec):
+        return format(value, spec) if value is not None else "-"
+
+    epoch = f"{fmt(s['epoch'], 'd')}/{fmt(s['max_epochs'], 'd')}"
+    eta = s["eta_hours"]
+    eta_text = "-" if eta is None else (f"{eta * 60:.0f}m" if eta < 1 else f"{eta:.1f}h")
+    snap = fmt(s["latest_snapshot"], "d")
+    if s["best_snapshot"] is not None:
+        snap += f" (best {s['best_snapshot']})"
+    map_text = f" | mAP {s['metrics']['test.mAP']:.2f}" if "test.mAP" in s["metrics"] else ""
+    return (f"{s['run']}: epoch {epoch} | loss {fmt(s['loss'], '.4f')} (ema {fmt(s['loss_ema'], '.4f')})"
+            f" | eval {fmt(s['eval_loss'], '.4f')}{map_text} | {fmt(s['epochs_per_hour'], '.1f')} ep/h"
+            f" | ETA {eta_text} | snapshot {snap}")
+
+
+def discover_train_folders(paths):
+    """
+    Accepts project, dlc-models-pytorch, iteration-N or train folders and returns all train folders.
+    Only the fixed model-folder layout is globbed, never the whole project (labeled-data, videos, ...).
+    """
+    folders = []
+    for p in map(Path, paths):
+        if p.name == "train" and ((p / STATS_FILENAME).exists() or (p / "pytorch_config.yaml").exists()):
+            folders.append(p)
+        elif (p / "dlc-models-pytorch").is_dir():
+            folders.extend(sorted(p.glob("dlc-models-pytorch/iteration-*/*/train")))
+        elif p.name == "dlc-models-pytorch":
+            folders.extend(sorted(p.glob("iteration-*/*/train")))
+        elif p.name.startswith("iteration-"):
+            folders.extend(sorted(p.glob("*/train")))
+    return [f.resolve() for f in folders if f.is_dir()]
+
+
+class MonitorGroup:
+    """
+    Polls several runs from one background thread; status() is safe to call from HTTP handlers.
+    New runs (e.g. a new shuffle) are looked for every `rediscover_seconds`, not on every poll.
+    """
+
+    def __init__(self, paths, max_epochs=None, ema_alpha=0.1, rediscover_seconds=300):
+        self.paths = paths
+        self.max_epochs = max_epochs
+        self.ema_alpha = ema_alpha
+        self.rediscover_seconds = rediscover_seconds
+        self.monitors = {}
+        self._discovered_at = None
+        self._lock = threading.Lock()
+        self._statuses = []
+
+    def poll(self):
+        now = time.time()
+        if self._discovered_at is None or now - self._discovered_at >= self.rediscover_seconds:
+            self._discovered_at = now
+            for folder in discover_train_folders(self.paths):
+                if folder not in self.monitors:
+                    self.monitors[folder] = RunMonitor(folder, max_epochs=self.max_epochs, ema_alpha=self.ema_alpha)
+        statuses = [m.poll() for m in self.monitors.values()]
+        with self._lock:
+            self._statuses = statuses
+        return statuses
+
+    def status(self):
+        with self._lock:
+            return list(self._statuses)
+
+
+def serve(group, port, interval):
+    """Serves /status (JSON) and / (plain status lines) while polling in the background."""
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            statuses = group.status()
+            if self.path.rstrip("/") == "/status":
+                body, content_type = json.dumps(statuses).encode(), "application/json"
+            else:
+                body = "\n".join(format_status_line(s) for s in statuses).encode()
+                content_type = "text/plain; charset=utf-8"
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    def poll_forever():
+        while True:
+            group.poll()
+            time.sleep(interval)
+
+    threading.Thread(target=poll_forever, daemon=True).start()
+    server = ThreadingHTTPServer(("", port), Handler)
+    print(f"🌐 Serving training status on http://localhost:{port}/status (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n🛑 Monitor stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Monitor DLC3 training runs incrementally.")
+    parser.add_argument("paths", nargs="*", help="project, dlc-models-pytorch or train folders")
+    parser.add_argument("--interval", type=float, default=10.0, help="seconds between polls (default 10)")
+    parser.add_argument("--max-epochs", type=int, default=None, help="override the target epochs for the ETA")
+    parser.add_argument("--ema", type=float, default=0.1, help="smoothing factor of the loss EMA (default 0.1)")
+    parser.add_argument("--json", action="store_true", help="print JSON instead of status lines")
+    parser.add_argument("--once", action="store_true", help="poll a single time and exit")
+    parser.add_argument("--serve", type=int, metavar="PORT", default=None, help="serve JSON status over HTTP")
+    args = parser.parse_args()
+
+    paths = args.paths or [input("Enter the full path to your DLC project folder: ").strip().strip('"')]
+    group = MonitorGroup(paths, max_epochs=args.max_epochs, ema_alpha=args.ema)
+
+    if args.serve is not None:
+        serve(group, args.serve, args.interval)
+        return
+
+    try:
+        while True:
+            statuses = group.poll()
+            if args.json:
+                print(json.dumps(statuses), flush=True)
+            else:
+                print(time.strftime("[%H:%M:%S]"))
+                for s in statuses:
+                    print("  " + format_status_line(s))
+            if args.once:
+                break
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        print("\n🛑 Monitor stopped.")
+
+
+if __name__ == "__main__":
+    main()
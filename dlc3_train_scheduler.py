@@ -0,0 +1,363 @@
+# FILE: dlc3_train_scheduler.py
+# Purpose: Run a queue of DLC3 CPU trainings side by side without the jobs fighting over the cores.
+# Version: v1, fixed core partition per slot (CPU affinity + torch/OpenMP threads), throughput log per job.
+#
+# Several torch trainings started by hand each use every core and slow each other down. Here the physical
+# cores (with their SMT sibling threads) are split into `slots` disjoint groups; each queued job runs in its
+# own process pinned to one group, with torch/OpenMP/MKL thread counts set to its number of physical cores,
+# and calls the same launch_training() (deeplabcut.train_network) as dlc3_v5.py. Throughput is appended
+# to a JSONL file while jobs run.
+#
+# Example job spec (YAML):
+#
+#   slots: 3                        # trainings running at the same time (cores are split evenly)
+#   cores: null                     # optional list of core ids to use (default: all available)
+#   log: scheduler_throughput.jsonl # relative to the spec file
+#   defaults:
+#     shuffle: 1
+#     save_epochs: 50
+#   jobs:
+#     - config: Feb-Thomas-2025-10-03/config.yaml
+#       epochs: 500                 # total epochs to reach
+#       resume: latest              # latest (default) | fresh | <epoch> | path to a snapshot
+#     - config: Mar-Thomas-2025-11-12/config.yaml
+#       shuffle: 2
+#       epochs: 300
+
+import argparse
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from collections import deque
+from datetime import datetime
+from pathlib import Path
+
+import yaml
+
+from dlc3_batch_runner import LOG_DIRNAME
+
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+
+# ===================================================================
+# CORE PARTITIONING
+# ===================================================================
+
+def available_cores():
+    """Core ids this process may run on (respects an affinity set by the cluster scheduler)."""
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    try:
+        import psutil
+        return sorted(psutil.Process().cpu_affinity())
+    except (ImportError, AttributeError):
+        return list(range(os.cpu_count() or 1))
+
+
+def _parse_cpu_list(text):
+    """Parses a Linux CPU list such as '0,32' or '0-1' into core ids."""
+    ids = []
+    for part in text.strip().split(","):
+        if "-" in part:
+            first, last = part.split("-")
+            ids.extend(range(int(first), int(last) + 1))
+        elif part:
+            ids.append(int(part))
+    return ids
+
+
+def _sibling_threads(core):
+    """Logical CPU ids sharing a physical core with `core` (including itself)."""
+    path = Path(f"/sys/devices/system/cpu/cpu{core}/topology/thread_siblings_list")
+    try:
+        return _parse_cpu_list(path.read_text())
+    except (OSError, ValueError):
+        pass
+    try:
+        import psutil
+        logical, physical = psutil.cpu_count(), psutil.cpu_count(logical=False)
+    except ImportError:
+        logical = physical = None
+    if logical and physical and logical > physical and logical % physical == 0:
+        # No sysfs (Windows): sibling threads are numbered next to each other there
+        per_core = logical // physical
+        first = core - core % per_core
+        return list(range(first, first + per_core))
+    return [core]
+
+
+def physical_cores(cores):
+    """Groups logical core ids into physical cores, e.g. [0, 1, 32, 33] -> [[0, 32], [1, 33]] with SMT."""
+    available = set(cores)
+    groups, seen = [], set()
+    for core in cores:
+        if core in seen:
+            continue
+        siblings = sorted({core, *(c for c in _sibling_threads(core) if c in available)})
+        seen.update(siblings)
+        groups.append(siblings)
+    return groups
+
+
+def partition_cores(cores, slots):
+    """
+    Splits cores into `slots` groups of (nearly) equal numbers of physical cores. SMT sibling threads
+    always land in the same group, so two jobs never share the execution units of one physical core.
+    """
+    physical = physical_cores(cores)
+    slots = max(1, min(slots, len(physical)))
+    size, extra = divmod(len(physical), slots)
+    groups, start = [], 0
+    for i in range(slots):
+        end = start + size + (1 if i < extra else 0)
+        groups.append(sorted(c for siblings in physical[start:end] for c in siblings))
+        start = end
+    return groups
+
+
+def pin_to_cores(cores):
+    """Restricts the current process (and the data-loader workers it starts) to the given cores."""
+    if hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cores)
+        return "sched_setaffinity"
+    try:
+        import psutil
+        psutil.Process().cpu_affinity(list(cores))
+        return "psutil"
+    except (ImportError, AttributeError):
+        print("⚠️ Cannot set CPU affinity here (install psutil) — only thread counts are limited.")
+        return None
+
+
+# ===================================================================
+# ONE JOB (runs in its own process)
+# ===================================================================
+
+def resolve_resume(job, train_folder):
+    """Returns (snapshot path or None, start epoch) for the job's 'resume' setting."""
+    from dlc3_v5 import find_snapshots
+
+    resume = job.get("resume", "latest")
+    if resume in (None, False, "fresh"):
+        return None, 0
+    snapshots = find_snapshots(str(train_folder)) if train_folder else {}
+    if resume == "latest":
+        if not snapshots:
+            return None, 0
+        epoch = max(snapshots)
+        return snapshots[epoch], epoch
+    if isinstance(resume, int) or str(resume).isdigit():
+        epoch = int(resume)
+        if epoch not in snapshots:
+            raise FileNotFoundError(f"❌ No snapshot for epoch {epoch} in {train_folder}")
+        return snapshots[epoch], epoch
+    path = Path(resume)
+    if not path.exists():
+        raise FileNotFoundError(f"❌ Resume snapshot not found: {path}")
+    return path, int(path.stem.split("-")[-1])
+
+
+def _run_job(job, cores, threads, log_path, results):
+    # Thread pools read these when torch / numpy are first imported, so set them before anything else
+    for var in THREAD_ENV_VARS:
+        os.environ[var] = str(threads)
+
+    with open(log_path, "w", encoding="utf-8", buffering=1) as log:
+        sys.stdout = sys.stderr = log
+        try:
+            affinity = pin_to_cores(cores)
+            print(f"🧩 Job {job['name']}: cores {cores}, {threads} thread(s) (affinity: {affinity})")
+
+            from dlc3_v5 import find_train_folder, launch_training, lower_learning_rate_for_resume
+
+            train_folder = find_train_folder(job["config"], shuffle=job["shuffle"])
+            snapshot_path, start_epoch = resolve_resume(job, train_folder)
+            results.put({"job": job["id"], "event": "started", "start_epoch": start_epoch})
+            if start_epoch >= job["epochs"]:
+                print(f"✅ Snapshot for epoch {start_epoch} already reaches the target of {job['epochs']} epochs.")
+                results.put({"job": job["id"], "event": "done", "status": "skipped", "end_epoch": start_epoch})
+                return
+
+            if snapshot_path is not None:
+                print(f"▶️ Resuming from {snapshot_path} up to epoch {job['epochs']}.")
+                lower_learning_rate_for_resume(train_folder / "pytorch_config.yaml")
+            else:
+                print(f"🚀 Starting a fresh training run ({job['epochs']} epochs).")
+            launch_training(job["config"], job["epochs"], job["save_epochs"], snapshot_path=snapshot_path,
+                            shuffle=job["shuffle"], snapshot_precision=job.get("snapshot_precision"),
+                            torch_threads=threads, rebuild_image_cache=False)
+            results.put({"job": job["id"], "event": "done", "status": "ok", "end_epoch": job["epochs"]})
+        except Exception as e:
+            import traceback
+            traceback.print_exc()
+            results.put({"job": job["id"], "event": "done", "status": "failed", "error": f"{type(e).__name__}: {e}"})
+
+
+# ===================================================================
+# SCHEDULER
+# ===================================================================
+
+def load_schedule(spec_path):
+    """Loads a YAML or JSON schedule and expands it into one job dict per queued training."""
+    spec_path = Path(spec_path)
+    with open(spec_path, "r", encoding="utf-8") as f:
+        spec = json.load(f) if spec_path.suffix.lower() == ".json" else yaml.safe_load(f)
+
+    defaults = {"shuffle": 1, "save_epochs": 50, "resume": "latest", **spec.get("defaults", {})}
+    jobs = []
+    for i, entry in enumerate(spec.get("jobs", [])):
+        job = {**defaults, **entry}
+        if "config" not in job or "epochs" not in job:
+            raise ValueError(f"❌ Job #{i + 1} in {spec_path} needs 'config' and 'epochs'.")
+        job["config"] = str((spec_path.parent / job["config"]).resolve())  # relative to the spec
+        if not Path(job["config"]).exists():
+            raise FileNotFoundError(f"❌ Config file not found: {job['config']}")
+        job.setdefault("name", f"{Path(job['config']).parent.name}-shuffle{job['shuffle']}")
+        job["id"] = i
+        jobs.append(job)
+    return spec, jobs
+
+
+class _Running:
+    """Book-keeping of one running job in the scheduler process."""
+
+    def __init__(self, job, cores, threads, process, log_path):
+        self.job = job
+        self.cores = cores
+        self.threads = threads  # physical cores of the slot
+        self.process = process
+        self.log_path = log_path
+        self.started = time.time()
+        self.start_epoch = None
+        self.monitor = None
+        self.result = None
+
+    def poll_monitor(self):
+        from dlc3_monitor import RunMonitor
+        from dlc3_v5 import find_train_folder
+
+        if self.monitor is None:
+            train_folder = find_train_folder(self.job["config"], shuffle=self.job["shuffle"])
+            if train_folder is None or not (train_folder / "learning_stats.csv").exists():
+                return None
+            self.monitor = RunMonitor(train_folder, max_epochs=self.job["epochs"])
+        return self.monitor.poll()
+
+
+def run_schedule(spec_path, slots=None, log_interval=60):
+    """Runs the queued trainings, `slots` at a time on disjoint core groups. Returns the per-job records."""
+    spec_path = Path(spec_path).resolve()
+    spec, jobs = load_schedule(spec_path)
+    cores = spec.get("cores") or available_cores()
+    groups = partition_cores(cores, slots or spec.get("slots") or 1)
+    threads = [len(physical_cores(group)) for group in groups]
+    log_path = spec_path.parent / spec.get("log", "scheduler_throughput.jsonl")
+
+    def log_event(record):
+        record = {"time": datetime.now().isoformat(timespec="seconds"), **record}
+        with open(log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record) + "\n")
+
+    print(f"🧩 {len(jobs)} job(s) on {len(cores)} logical core(s): {len(groups)} slot(s) of "
+          f"{', '.join(str(t) for t in threads)} physical core(s). Throughput log: {log_path}")
+
+    from dlc3_image_cache import refresh_image_cache
+
+    ctx = mp.get_context("spawn")
+    results = ctx.Queue()
+    pending = deque(jobs)
+    free = deque(range(len(groups)))
+    running = {}
+    records = []
+
+    while pending or running:
+        while pending and free:
+            job, slot = pending.popleft(), free.popleft()
+            # Jobs of one project share its image cache, so only the scheduler (re)builds it, and only while
+            # no job of that project is reading it; the jobs themselves never write to it
+            if not any(r.job["config"] == job["config"] for _, r in running.values()):
+                refresh_image_cache(job["config"])
+            job_log_dir = Path(job["config"]).parent / LOG_DIRNAME
+            job_log_dir.mkdir(exist_ok=True)
+            job_log = job_log_dir / f"train_{datetime.now():%Y%m%d_%H%M%S}_{job['id']}.log"
+            process = ctx.Process(target=_run_job, args=(job, groups[slot], threads[slot], job_log, results),
+                                  daemon=False)
+            process.start()
+            running[job["id"]] = (slot, _Running(job, groups[slot], threads[slot], process, job_log))
+            print(f"▶️ [{slot}] {job['name']} → {threads[slot]} physical core(s), log {job_log}")
+            log_event({"event": "start", "job": job["name"], "slot": slot, "cores": groups[slot],
+                       "physical_cores": threads[slot], "target_epochs": job["epochs"]})
+
+        # Collect messages from the job processes (start epoch, result) until the next status check
+        deadline = time.time() + log_interval
+        while True:
+            exited = any(not r.process.is_alive() for _, r in running.values())
+            timeout = 0 if exited else min(deadline - time.time(), 5)
+            try:
+                message = results.get(timeout=max(timeout, 0.1))
+            except queue.Empty:
+                if exited or time.time() >= deadline:
+                    break
+                continue
+            if message["job"] in running:
+                entry = running[message["job"]][1]
+                if message["event"] == "started":
+                    entry.start_epoch = message["start_epoch"]
+                else:
+                    entry.result = message
+
+        for job_id, (slot, entry) in list(running.items()):
+            status = entry.poll_monitor()
+            if entry.process.is_alive():
+                if status:
+                    log_event({"event": "progress", "job": entry.job["name"], "slot": slot,
+                               "cores": entry.threads, "epoch": status["epoch"],
+                               "epochs_per_hour": status["epochs_per_hour"], "eta_hours": status["eta_hours"]})
+                    print(f"   [{slot}] {entry.job['name']}: epoch {status['epoch']}/{entry.job['epochs']}, "
+                          f"{status['epochs_per_hour'] or '-'} ep/h on {entry.threads} core(s)")
+                continue
+
+            entry.process.join()
+            result = entry.result or {"status": "failed", "error": f"process exited with code {entry.process.exitcode}"}
+            hours = (time.time() - entry.started) / 3600
+            end_epoch = (status or {}).get("epoch") or result.get("end_epoch")
+            trained = (end_epoch - entry.start_epoch) if end_epoch is not None and entry.start_epoch is not None else None
+            rate = trained / hours if trained and hours > 0 else None
+            record = {
+                "event": "finish", "job": entry.job["name"], "config": entry.job["config"],
+                "shuffle": entry.job["shuffle"], "slot": slot, "cores": entry.threads,
+                "status": result["status"], "error": result.get("error"),
+                "start_epoch": entry.start_epoch, "end_epoch": end_epoch, "hours": round(hours, 3),
+                "epochs_per_hour": round(rate, 2) if rate else None,
+                "epochs_per_hour_per_core": round(rate / entry.threads, 3) if rate else None,
+                "log": str(entry.log_path),
+            }
+            log_event(record)
+            records.append(record)
+            icon = "✅" if result["status"] in ("ok", "skipped") else "❌"
+            rate_text = f", {record['epochs_per_hour']} ep/h" if rate else ""
+            print(f"{icon} [{slot}] {entry.job['name']}: {result['status']}{rate_text}"
+                  + (f" ({result['error']})" if result.get("error") else ""))
+            del running[job_id]
+            free.append(slot)
+
+    print(f"\n📄 Throughput per job appended to {log_path}")
+    return records
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run queued DLC3 CPU trainings on partitioned cores.")
+    parser.add_argument("spec", help="path to the schedule (.yaml, .yml or .json)")
+    parser.add_argument("--slots", type=int, default=None, help="trainings running at the same time")
+    parser.add_argument("--interval", type=float, default=60, help="seconds between throughput samples")
+    args = parser.parse_args()
+
+    records = run_schedule(args.spec, slots=args.slots, log_interval=args.interval)
+    raise SystemExit(1 if any(r["status"] == "failed" for r in records) else 0)
+
+
+if __name__ == "__main__":
+    main()
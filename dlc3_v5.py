@@ -7,10 +7,19 @@ import os
 import yaml
 import glob
 import re
+from contextlib import nullcontext
 from pathlib import Path
 from deeplabcut.utils import auxiliaryfunctions
 import pandas as pd
 
+try:
+    # Only in patched_DLC3_files/snapshots.py: reduced-precision, compressed retained snapshots
+    from deeplabcut.pose_estimation_pytorch.runners.snapshots import SNAPSHOT_PRECISION_ENV, loadable_snapshot
+except ImportError:
+    # Stock DLC never writes compressed snapshots, so every snapshot can be loaded as is
+    loadable_snapshot = nullcontext
+    SNAPSHOT_PRECISION_ENV = None
+
 def find_training_folders(project_path):
     """Finds all 'train' directories within the dlc-models-pytorch structure."""
     pytorch_models_dir = project_path / "dlc-models-pytorch"
@@ -33,6 +42,17 @@ def get_training_folder_choice(folders):
             pass
         print("❌ Invalid input, try again.")
 
+def find_train_folder(config_path, shuffle=1, iteration=None):
+    """Returns the train folder of a shuffle in the given (default: current) iteration, or None."""
+    config_path = Path(config_path)
+    if iteration is None:
+        with open(config_path, "r", encoding="utf-8") as f:
+            iteration = yaml.safe_load(f).get("iteration", 0)
+    for folder in find_training_folders(config_path.parent):
+        if folder.parents[1].name == f"iteration-{iteration}" and folder.parent.name.endswith(f"shuffle{shuffle}"):
+            return folder
+    return None
+
 def find_snapshots(train_folder_path):
     """Finds and sorts all snapshots in a given training folder."""
     print(f"🔍 Searching for snapshots in: {train_folder_path}")
@@ -45,19 +65,40 @@ def find_snapshots(train_folder_path):
             snapshots[int(match.group(1))] = f
     return dict(sorted(snapshots.items(), key=lambda item: item[0], reverse=True))
 
-def get_snapshot_choice(snapshots):
+def print_snapshot_list(snapshots, train_folder_path=None):
+    """Lists the snapshots, with test-set metrics if dlc3_eval_sweep.py has evaluated them."""
+    from dlc3_eval_sweep import format_metric, load_sweep_table
+
+    table = load_sweep_table(train_folder_path) if train_folder_path else {}
+    metrics = {Path(path).name: table.get(Path(path).name) for path in snapshots.values()}
+    print("\n--- Available Snapshots ---")
+    if not any(metrics.values()):
+        for e in sorted(snapshots.keys()):
+            print(f"  Epoch {e}")
+        print("  (type 'sweep' to evaluate all snapshots on the test set)")
+        return
+    print(f"  {'Epoch':>6}  {'RMSE':>8}  {'RMSE@p':>8}  {'mAP':>7}")
+    for e in sorted(snapshots.keys()):
+        row = metrics[Path(snapshots[e]).name] or {}
+        print(f"  {e:>6}  {format_metric(row, 'rmse'):>8}  {format_metric(row, 'rmse_pcutoff'):>8}  {format_metric(row, 'mAP'):>7}")
+
+def get_snapshot_choice(snapshots, config_path=None, train_folder_path=None):
     """Asks the user to select a snapshot to resume from."""
     if not snapshots:
         return None
     latest_epoch = max(snapshots.keys())
     while True:
-        choice = input(f"\nLatest snapshot found: epoch {latest_epoch}. Resume from this one? (Y/n/list): ").lower().strip()
+        choice = input(f"\nLatest snapshot found: epoch {latest_epoch}. Resume from this one? (Y/n/list/sweep): ").lower().strip()
         if choice in ('y', 'yes', ''):
             return latest_epoch
-        elif choice == 'list':
-            print("\n--- Available Snapshots ---")
-            for e in sorted(snapshots.keys()):
-                print(f"  Epoch {e}")
+        elif choice in ('list', 'sweep'):
+            if choice == 'sweep' and config_path and train_folder_path:
+                from dlc3_eval_sweep import run_sweep
+                try:
+                    run_sweep(config_path, train_folder_path)
+                except ValueError as e:
+                    print(e)
+            print_snapshot_list(snapshots, train_folder_path)
             try:
                 ep = int(input("Enter epoch to resume from: "))
                 if ep in snapshots:
@@ -68,6 +109,92 @@ def get_snapshot_choice(snapshots):
         elif choice in ('n', 'no', 'exit', 'quit'):
             return None
 
+def lower_learning_rate_for_resume(pytorch_config_path, max_lr=0.0003):
+    """Caps the optimizer learning rate in pytorch_config.yaml for continued training stability."""
+    pytorch_config_path = Path(pytorch_config_path)
+    if not pytorch_config_path.exists():
+        return
+    with open(pytorch_config_path, "r") as f:
+        pt_cfg = yaml.safe_load(f)
+
+    if "optimizer" in pt_cfg.get("runner", {}):
+        current_lr = pt_cfg["runner"]["optimizer"]["params"].get("lr", 0.0005)
+        if current_lr > max_lr:
+            pt_cfg["runner"]["optimizer"]["params"]["lr"] = max_lr
+            print(f"⚙️ Lowered learning rate to {max_lr} for continued training stability.")
+
+    with open(pytorch_config_path, "w") as f:
+        yaml.dump(pt_cfg, f)
+        print("✅ Updated pytorch_config.yaml with a potentially lower learning rate.")
+
+def launch_training(config_path, total_epochs, save_interval, snapshot_path=None, shuffle=1, snapshot_precision=None,
+                    torch_threads=None, rebuild_image_cache=True):
+    """
+    Starts (or resumes, if snapshot_path is given) deeplabcut.train_network with the script's defaults.
+    snapshot_precision ("fp16"/"bf16") stores older retained snapshots compressed (patched snapshots.py only).
+    torch_threads overrides the autotuned thread count, rebuild_image_cache=False leaves a stale image cache
+    alone (both used by dlc3_train_scheduler.py, where concurrent jobs share a project's cache).
+    """
+    # Serve training frames from the pre-decoded image cache if the project has one
+    from dlc3_image_cache import prepare_image_cache_for_training
+    prepare_image_cache_for_training(config_path, rebuild=rebuild_image_cache)
+
+    if torch_threads:
+        import torch
+        torch.set_num_threads(torch_threads)
+        print(f"⚙️ Using {torch_threads} torch threads.")
+    else:
+        # Use the torch thread count found by dlc3_autotune.py for this run, if any
+        from dlc3_autotune import apply_autotuned_threads
+        apply_autotuned_threads(find_train_folder(config_path, shuffle=shuffle))
+
+    previous_precision = os.environ.get(SNAPSHOT_PRECISION_ENV) if SNAPSHOT_PRECISION_ENV else None
+    if snapshot_precision:
+        if SNAPSHOT_PRECISION_ENV is None:
+            print("⚠️ Snapshot compression needs patched_DLC3_files/snapshots.py — saving full snapshots.")
+        else:
+            os.environ[SNAPSHOT_PRECISION_ENV] = snapshot_precision
+            print(f"🗜 Older retained snapshots will be stored as {snapshot_precision} + compression.")
+
+    try:
+        # A compressed snapshot is resumed from a temporary full-precision copy
+        with loadable_snapshot(snapshot_path) if snapshot_path is not None else nullcontext() as resume_path:
+            kwargs = {}
+            if resume_path is not None:
+                # Pass snapshot_path directly to train_network to resume training
+                kwargs["snapshot_path"] = str(resume_path)
+            deeplabcut.train_network(
+                config=str(config_path),
+                shuffle=shuffle,
+                maxiters=total_epochs,
+                saveiters=save_interval,
+                displayiters=1000,
+                **kwargs,
+            )
+    finally:
+        # Only this run compresses: later trainings in the same process get the previous setting back
+        if snapshot_precision and SNAPSHOT_PRECISION_ENV is not None:
+            if previous_precision is None:
+                os.environ.pop(SNAPSHOT_PRECISION_ENV, None)
+            else:
+                os.environ[SNAPSHOT_PRECISION_ENV] = previous_precision
+
+def ask_autotune(config_path, train_folder_path):
+    """Offers to run the CPU autotuner (dlc3_autotune.py) before training is launched."""
+    if train_folder_path is None or not (train_folder_path / "pytorch_config.yaml").exists():
+        return
+    choice = input("Autotune batch size / data-loader workers / torch threads on CPU first? (y/N): ").lower().strip()
+    if choice in ('y', 'yes'):
+        from dlc3_autotune import run_autotune
+        run_autotune(config_path, train_folder_path)
+
+def ask_snapshot_precision():
+    """Offers to store older retained snapshots with reduced precision (needs the patched snapshots.py)."""
+    if SNAPSHOT_PRECISION_ENV is None:
+        return None
+    choice = input("Store older retained snapshots as bf16/fp16 + compression? (bf16/fp16/N): ").lower().strip()
+    return choice if choice in ('bf16', 'fp16') else None
+
 def run_interactive_training():
     """Main function to run the interactive training script."""
     # --- Project selection ---
@@ -101,21 +228,17 @@ def run_interactive_training():
         print("\n🚀 Starting a *fresh* training run.")
         total_epochs = int(input("How many epochs to train? (e.g., 500): "))
         save_interval = int(input("Save a snapshot every X epochs (e.g., 50): "))
+        ask_autotune(config_path, train_folder_path)
+        snapshot_precision = ask_snapshot_precision()
 
-        deeplabcut.train_network(
-            config=str(config_path),
-            shuffle=1,
-            maxiters=total_epochs,
-            saveiters=save_interval,
-            displayiters=1000,
-        )
+        launch_training(config_path, total_epochs, save_interval, snapshot_precision=snapshot_precision)
         print("✅ Training started successfully.")
         return
 
     # ===============================================================
     # RESUME TRAINING
     # ===============================================================
-    resume_epoch = get_snapshot_choice(available_snapshots)
+    resume_epoch = get_snapshot_choice(available_snapshots, config_path, train_folder_path)
     if resume_epoch is None:
         print("Exiting.")
         return
@@ -127,35 +250,17 @@ def run_interactive_training():
     save_interval = int(input("Save a new snapshot every X epochs (e.g., 50): "))
 
     # --- Lower learning rate for continued training if necessary ---
-    pytorch_config_path = train_folder_path / "pytorch_config.yaml"
-    if pytorch_config_path.exists():
-        with open(pytorch_config_path, "r") as f:
-            pt_cfg = yaml.safe_load(f)
-        
-        if "optimizer" in pt_cfg.get("runner", {}):
-            current_lr = pt_cfg["runner"]["optimizer"]["params"].get("lr", 0.0005)
-            if current_lr > 0.0003:
-                pt_cfg["runner"]["optimizer"]["params"]["lr"] = 0.0003
-                print("⚙️ Lowered learning rate to 0.0003 for continued training stability.")
-        
-        with open(pytorch_config_path, "w") as f:
-            yaml.dump(pt_cfg, f)
-            print("✅ Updated pytorch_config.yaml with a potentially lower learning rate.")
+    lower_learning_rate_for_resume(train_folder_path / "pytorch_config.yaml")
+    ask_autotune(config_path, train_folder_path)
+    snapshot_precision = ask_snapshot_precision()
 
     total_epochs = resume_epoch + additional_epochs
 
     print(f"\n⚙️ Training for {additional_epochs} new epochs (up to a total of {total_epochs}). Saving every {save_interval} epochs.")
     print("\n🚀 Launching resumed training...")
 
-    # Pass snapshot_path directly to train_network to resume training
-    deeplabcut.train_network(
-        config=str(config_path),
-        shuffle=1,
-        maxiters=total_epochs,
-        saveiters=save_interval,
-        displayiters=1000,
-        snapshot_path=str(chosen_snapshot_path),
-    )
+    launch_training(config_path, total_epochs, save_interval, snapshot_path=chosen_snapshot_path,
+                    snapshot_precision=snapshot_precision)
 
     print("\n✅ Training process finished successfully.")
 
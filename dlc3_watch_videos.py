@@ -0,0 +1,372 @@
+# FILE: dlc3_watch_videos.py
+# Purpose: Watch a video archive, register newly arriving videos in config.yaml and extract frames for them only.
+# Version: v1, long-running companion to dlc3_extract_v3.py (which replaces video_sets wholesale).
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from pathlib import Path
+
+import cv2
+import ruamel.yaml
+
+SUPPORTED_VIDEO_EXTS = (".avi", ".mp4", ".mov", ".mkv")
+STATE_FILENAME = ".dlc3_watch_state.json"
+
+
+def _norm(path):
+    """Normalizes a path so that the same file always maps to the same key (Windows is case-insensitive)."""
+    return os.path.normcase(os.path.abspath(str(path)))
+
+
+def probe_video(video_path):
+    """Reads the first frame of a video and returns its DLC crop string, or None if unreadable."""
+    cap = cv2.VideoCapture(str(video_path))
+    ok, frame = cap.read()
+    cap.release()
+    if not ok or frame is None:
+        return None
+    h, w = frame.shape[:2]
+    return f"0,{w},0,{h}"
+
+
+def load_config(config_path):
+    """Loads config.yaml with ruamel (quotes preserved) and returns (yaml, cfg)."""
+    yaml = ruamel.yaml.YAML()
+    yaml.preserve_quotes = True
+    with open(config_path, "r", encoding="utf-8") as f:
+        cfg = yaml.load(f)
+    return yaml, cfg
+
+
+def write_config_atomically(config_path, yaml, cfg):
+    """Writes config.yaml through a temporary file + os.replace so readers never see a half-written file."""
+    config_path = Path(config_path)
+    tmp_path = config_path.with_name(config_path.name + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        yaml.dump(cfg, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, config_path)
+
+
+def add_to_video_sets(config_path, new_entries):
+    """
+    Appends {video_path: crop} entries to video_sets in ONE config update.
+    Videos that are already listed are left untouched. Returns the list of videos actually added.
+    """
+    yaml, cfg = load_config(config_path)
+    video_sets = cfg.get("video_sets") or {}
+    listed = {_norm(v) for v in video_sets}
+
+    added = []
+    for video, crop in new_entries.items():
+        if _norm(video) in listed:
+            continue
+        video_sets[video] = {"crop": crop}
+        listed.add(_norm(video))
+        added.append(video)
+
+    if added:
+        cfg["video_sets"] = video_sets
+        write_config_atomically(config_path, yaml, cfg)
+    return added
+
+
+def find_unregistered_videos(config_path, video_root, extensions=SUPPORTED_VIDEO_EXTS):
+    """
+    Lists the videos under video_root that are not in video_sets, walking the tree directly.
+    Unlike VideoWatcher, the watch state file (baseline, handled videos) is not consulted.
+    """
+    _, cfg = load_config(config_path)
+    listed = {_norm(v) for v in (cfg.get("video_sets") or {})}
+    extensions = tuple(e.lower() for e in extensions)
+    found = []
+    for dirpath, _, filenames in os.walk(video_root):
+        for name in filenames:
+            path = os.path.join(dirpath, name)
+            if name.lower().endswith(extensions) and _norm(path) not in listed:
+                found.append(path)
+    return sorted(found)
+
+
+def extract_new_videos(config_path, videos, **writer_options):
+    """Extracts frames (automatic kmeans selection) for the given videos only, see dlc3_frame_writer.py."""
+    from dlc3_frame_writer import extract_frames_parallel
+
+    return extract_frames_parallel(
+        config_path,
+        list(videos),
+        algo="kmeans",
+        cluster_step=10,          # speed up extraction (downsample frames)
+        cluster_resizewidth=150,  # smaller frames for kmeans
+        **writer_options,
+    )
+
+
+class VideoWatcher:
+    """
+    Polls a directory tree for new video files with as little disk traffic as possible.
+
+    Directories are only re-listed when their mtime changes; files that are still being written are
+    re-stat'ed individually until their size and mtime have been stable for `settle_seconds`. A file is
+    never probed on the poll that first sees it: its size must be unchanged on a later poll, since copy
+    tools that keep the source timestamps make a half-copied file look old.
+    Files already in video_sets, or recorded in the watch state file, are never reported again.
+    Registered videos whose frames are not extracted yet are kept in the state file as well
+    (`to_extract`), so an extraction that failed or was interrupted is retried on the next start.
+    """
+
+    def __init__(self, config_path, watch_root, settle_seconds=30.0, max_probe_failures=5,
+                 include_existing=False, extensions=SUPPORTED_VIDEO_EXTS):
+        self.config_path = Path(config_path)
+        self.watch_root = Path(watch_root).resolve()
+        self.settle_seconds = settle_seconds
+        self.max_probe_failures = max_probe_failures
+        self.extensions = tuple(e.lower() for e in extensions)
+        self.state_path = self.config_path.parent / STATE_FILENAME
+
+        self._dirs = {}          # dir -> (mtime_ns of its last listing, subdirectories)
+        self._pending = {}       # video -> (size, mtime_ns, first time seen with this size)
+        self._failures = {}      # video -> number of failed probes
+        self._handled = set()    # normalized paths that are registered or deliberately ignored
+        self._to_extract = []    # registered videos whose frames are not extracted yet
+        self._lock = threading.Lock()  # the extraction thread updates the state file too
+
+        _, cfg = load_config(self.config_path)
+        self._handled.update(_norm(v) for v in (cfg.get("video_sets") or {}))
+
+        if self.state_path.exists():
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            self._handled.update(state.get("handled", []))
+            self._to_extract = state.get("to_extract", [])
+        elif not include_existing:
+            # First start: the archive as it is now is the baseline, only later arrivals are "new".
+            baseline = self._list_changed_dirs()
+            self._handled.update(_norm(v) for v in baseline)
+            self._save_state()
+            print(f"📌 Baseline recorded: {len(baseline)} existing video(s) will be ignored.")
+
+    def _save_state(self):
+        with self._lock:
+            state = {"watch_root": str(self.watch_root), "handled": sorted(self._handled),
+                     "to_extract": list(self._to_extract)}
+            tmp_path = self.state_path.with_name(self.state_path.name + ".tmp")
+            try:
+                with open(tmp_path, "w", encoding="utf-8") as f:
+                    json.dump(state, f)
+                os.replace(tmp_path, self.state_path)
+            except OSError as e:  # e.g. file locked by another process on Windows
+                print(f"⚠️ Could not save the watch state ({e}); it is written again on the next change.")
+
+    def _list_changed_dirs(self):
+        """Walks the tree, re-listing only directories whose mtime changed. Returns the videos found in them."""
+        stack = [str(self.watch_root)]
+        seen_dirs = set()
+        videos = set()
+        while stack:
+            d = stack.pop()
+            seen_dirs.add(d)
+            try:
+                mtime = os.stat(d).st_mtime_ns
+            except OSError:
+                continue
+            cached = self._dirs.get(d)
+            if cached is not None and cached[0] == mtime:
+                stack.extend(cached[1])
+                continue
+
+            subdirs = []
+            try:
+                with os.scandir(d) as it:
+                    for entry in it:
+                        if entry.is_dir(follow_symlinks=False):
+                            subdirs.append(entry.path)
+                        elif entry.name.lower().endswith(self.extensions):
+                            videos.add(entry.path)
+            except OSError:
+                continue
+            self._dirs[d] = (mtime, subdirs)
+            stack.extend(subdirs)
+
+        # Forget directories that disappeared
+        for d in list(self._dirs):
+            if d not in seen_dirs:
+                del self._dirs[d]
+
+        return videos
+
+    def poll(self):
+        """Returns {video_path: crop} for videos that finished writing since the last poll."""
+        now = time.time()
+        for video in self._list_changed_dirs():
+            if _norm(video) not in self._handled and video not in self._pending:
+                self._pending[video] = None
+
+        settled = {}
+        for video, previous in list(self._pending.items()):
+            try:
+                st = os.stat(video)
+            except OSError:
+                self._pending.pop(video)  # deleted or renamed while being written
+                continue
+
+            signature = (st.st_size, st.st_mtime_ns)
+            if previous is None or previous[:2] != signature:
+                # New or still growing: wait for the next poll. An untouched file settles from its mtime.
+                stable_since = st.st_mtime if now - st.st_mtime >= self.settle_seconds else now
+                self._pending[video] = (*signature, stable_since)
+                continue
+            if now - previous[2] < self.settle_seconds:
+                continue
+
+            crop = probe_video(video)
+            if crop is None:
+                self._failures[video] = self._failures.get(video, 0) + 1
+                if self._failures[video] >= self.max_probe_failures:
+                    print(f"⚠️ Giving up on unreadable video: {video}")
+                    self._pending.pop(video)
+                    self._handled.add(_norm(video))
+                    self._save_state()
+                continue
+
+            self._pending.pop(video)
+            self._failures.pop(video, None)
+            settled[video] = crop
+        return settled
+
+    @property
+    def to_extract(self):
+        """Registered videos still waiting for frame extraction (e.g. after a failure or a restart)."""
+        with self._lock:
+            return list(self._to_extract)
+
+    def mark_handled(self, videos, to_extract=()):
+        """Records videos as processed (and `to_extract` as waiting for extraction) across restarts."""
+        with self._lock:
+            self._handled.update(_norm(v) for v in videos)
+            self._to_extract.extend(v for v in to_extract if v not in self._to_extract)
+        self._save_state()
+
+    def mark_extracted(self, videos):
+        """Removes videos from the extraction backlog once their frames were written."""
+        done = {_norm(v) for v in videos}
+        with self._lock:
+            self._to_extract = [v for v in self._to_extract if _norm(v) not in done]
+        self._save_state()
+
+
+def _extraction_worker(config_path, watcher, jobs):
+    """
+    Consumes batches of videos and extracts frames, merging batches that queued up meanwhile.
+    A video leaves the watcher's extraction backlog only after its own extraction succeeded.
+    """
+    stop = False
+    while not stop:
+        batch = jobs.get()
+        if batch is None:
+            return
+        videos = list(batch)
+        while True:
+            try:
+                more = jobs.get_nowait()
+            except queue.Empty:
+                break
+            if more is None:
+                stop = True
+                break
+            videos.extend(more)
+
+        print(f"\n🎞 Extracting frames for {len(videos)} new video(s)...")
+        for video in videos:
+            try:
+                extract_new_videos(config_path, [video])
+            except Exception as e:
+                print(f"❌ Extraction failed for {video}: {e} (will be retried on the next start)")
+                continue
+            watcher.mark_extracted([video])
+            print(f"✅ Extraction finished for {video}")
+
+
+def watch(config_path, watch_root, poll_interval=10.0, settle_seconds=30.0, include_existing=False,
+          extract=True, once=False):
+    """Main watch loop: poll, register new videos in one config update, queue their extraction."""
+    config_path = Path(config_path)
+    watcher = VideoWatcher(config_path, watch_root, settle_seconds=settle_seconds,
+                           include_existing=include_existing)
+
+    jobs = queue.Queue()
+    worker = None
+    if extract:
+        worker = threading.Thread(target=_extraction_worker, args=(config_path, watcher, jobs), daemon=True)
+        worker.start()
+        backlog = watcher.to_extract
+        if backlog:
+            print(f"🔁 Re-queueing {len(backlog)} registered video(s) whose frame extraction did not finish.")
+            jobs.put(backlog)
+
+    print(f"👀 Watching {watch_root} (poll every {poll_interval:g}s, settle after {settle_seconds:g}s). Ctrl+C to stop.")
+    unregistered = {}  # settled videos whose config update failed, retried on the next poll
+    scans = 0
+    try:
+        while True:
+            scans += 1
+            try:
+                unregistered.update(watcher.poll())
+                if unregistered:
+                    new_videos = unregistered
+                    added = add_to_video_sets(config_path, new_videos)
+                    unregistered = {}
+                    watcher.mark_handled(new_videos, to_extract=added if extract else ())
+                    if added:
+                        print(f"🔧 Added {len(added)} video(s) to video_sets:")
+                        for v in added:
+                            print(f"   + {v}  (crop {new_videos[v]})")
+                        if extract:
+                            jobs.put(added)
+            except Exception as e:  # e.g. config.yaml locked by another process on Windows
+                print(f"⚠️ Scan failed ({type(e).__name__}: {e}) — retrying on the next poll.")
+            if once and scans >= 2:
+                break  # --once: the second scan confirms the sizes seen by the first
+            time.sleep(poll_interval)
+    except KeyboardInterrupt:
+        print("\n🛑 Stopping watcher...")
+
+    if worker is not None:
+        jobs.put(None)
+        print("⏳ Waiting for queued extractions to finish...")
+        worker.join()
+    print("✅ Watcher stopped.")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Watch a folder tree and add new videos to a DLC project.")
+    parser.add_argument("config", nargs="?", help="path to the project's config.yaml")
+    parser.add_argument("watch_root", nargs="?", help="top-level directory where new videos arrive")
+    parser.add_argument("--poll", type=float, default=10.0, help="seconds between scans (default 10)")
+    parser.add_argument("--settle", type=float, default=30.0,
+                        help="seconds a file must stay unchanged before it is considered complete (default 30)")
+    parser.add_argument("--include-existing", action="store_true",
+                        help="on first start, treat videos already in the tree as new")
+    parser.add_argument("--no-extract", action="store_true", help="only register videos, do not extract frames")
+    parser.add_argument("--once", action="store_true",
+                        help="scan twice (one poll interval apart, to confirm file sizes) and exit")
+    args = parser.parse_args()
+
+    config_path = args.config or input("Enter full path to your DLC config.yaml: ").strip().strip('"')
+    if not Path(config_path).exists():
+        raise FileNotFoundError(f"❌ Config file not found: {config_path}")
+    watch_root = args.watch_root or input("Enter the directory to watch for new videos: ").strip().strip('"')
+    if not Path(watch_root).is_dir():
+        raise FileNotFoundError(f"❌ Watch directory not found: {watch_root}")
+
+    watch(config_path, watch_root, poll_interval=args.poll, settle_seconds=args.settle,
+          include_existing=args.include_existing, extract=not args.no_extract, once=args.once)
+
+
+if __name__ == "__main__":
+    main()
@@ -11,7 +11,15 @@
 """Code to handle storing models"""
 from __future__ import annotations
 
+import gzip
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
 import warnings
+from contextlib import contextmanager
 from dataclasses import dataclass, field
 from pathlib import Path
 
@@ -20,6 +28,123 @@ import torch
 
 from deeplabcut.pose_estimation_pytorch.data.snapshots import list_snapshots, Snapshot
 
+# Set to "fp16" or "bf16" to store intermediate snapshots with reduced precision + compression
+SNAPSHOT_PRECISION_ENV = "DLC_SNAPSHOT_PRECISION"
+SNAPSHOT_PRECISIONS = {"fp16": torch.float16, "bf16": torch.bfloat16}
+
+# Compressed snapshots keep their .pt name; this header tells them apart from torch pickles
+_COMPRESSED_MAGIC = b"DLCSNAPZ"
+_CHUNK_SIZE = 1 << 20
+
+
+def _compression_codec() -> str:
+    """Returns: "zstd" if the zstandard package is installed, otherwise "gzip"."""
+    try:
+        import zstandard  # noqa: F401
+    except ImportError:
+        return "gzip"
+    return "zstd"
+
+
+def is_compressed_snapshot(path: str | Path) -> bool:
+    """Returns: whether the snapshot was written by save_compressed_snapshot"""
+    with open(path, "rb") as f:
+        return f.read(len(_COMPRESSED_MAGIC)) == _COMPRESSED_MAGIC
+
+
+def save_compressed_snapshot(state_dict: dict, path: Path, precision: str) -> str:
+    """Stores a snapshot with reduced-precision model weights, stream-compressed
+
+    Only floating point tensors of the model weights are cast; the optimizer state
+    (if any) is kept as is. The file is written next to ``path`` and then moved over
+    it, so an interrupted save never leaves a broken snapshot behind.
+
+    Args:
+        state_dict: the snapshot to store
+        path: the path where the snapshot should be stored
+        precision: one of SNAPSHOT_PRECISIONS
+
+    Returns:
+        the compression codec that was used ("zstd" or "gzip")
+    """
+    dtype = SNAPSHOT_PRECISIONS[precision]
+    reduced = dict(state_dict)
+    reduced["model"] = {
+        k: v.to(dtype) if torch.is_tensor(v) and v.is_floating_point() else v
+        for k, v in state_dict["model"].items()
+    }
+    reduced["metadata"] = {**state_dict.get("metadata", {}), "stored_precision": precision}
+    buffer = io.BytesIO()
+    torch.save(reduced, buffer)
+    buffer.seek(0)
+
+    codec = _compression_codec()
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, "wb") as f:
+        f.write(_COMPRESSED_MAGIC + codec.encode().ljust(4))
+        if codec == "zstd":
+            import zstandard
+
+            compressor = zstandard.ZstdCompressor(level=3, threads=-1)
+            with compressor.stream_writer(f, closefd=False) as writer:
+                shutil.copyfileobj(buffer, writer, _CHUNK_SIZE)
+        else:
+            with gzip.GzipFile(fileobj=f, mode="wb", compresslevel=6) as writer:
+                shutil.copyfileobj(buffer, writer, _CHUNK_SIZE)
+    os.replace(tmp_path, path)
+    return codec
+
+
+def load_snapshot(path: str | Path, map_location: str | torch.device = "cpu") -> dict:
+    """Loads a plain or compressed snapshot; compressed weights are cast back to float32"""
+    with open(path, "rb") as f:
+        header = f.read(len(_COMPRESSED_MAGIC) + 4)
+        if header[: len(_COMPRESSED_MAGIC)] != _COMPRESSED_MAGIC:
+            return torch.load(path, map_location=map_location, weights_only=False)
+
+        codec = header[len(_COMPRESSED_MAGIC) :].decode().strip()
+        buffer = io.BytesIO()
+        if codec == "zstd":
+            import zstandard
+
+            with zstandard.ZstdDecompressor().stream_reader(f) as reader:
+                shutil.copyfileobj(reader, buffer, _CHUNK_SIZE)
+        else:
+            with gzip.GzipFile(fileobj=f, mode="rb") as reader:
+                shutil.copyfileobj(reader, buffer, _CHUNK_SIZE)
+
+    buffer.seek(0)
+    state_dict = torch.load(buffer, map_location=map_location, weights_only=False)
+    state_dict["model"] = {
+        k: v.float() if torch.is_tensor(v) and v.is_floating_point() else v
+        for k, v in state_dict["model"].items()
+    }
+    state_dict.get("metadata", {}).pop("stored_precision", None)
+    return state_dict
+
+
+@contextmanager
+def loadable_snapshot(path: str | Path):
+    """Yields a path that torch.load can read: the snapshot itself, or a temporary
+    full-precision copy if the snapshot is compressed (removed on exit).
+
+    Examples:
+        with loadable_snapshot(snapshot_path) as path:
+            deeplabcut.train_network(config, snapshot_path=str(path), ...)
+    """
+    path = Path(path)
+    if not is_compressed_snapshot(path):
+        yield path
+        return
+
+    tmp_dir = Path(tempfile.mkdtemp(prefix="dlc_snapshot_"))
+    try:
+        tmp_path = tmp_dir / path.name
+        torch.save(load_snapshot(path), tmp_path)
+        yield tmp_path
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
 
 @dataclass
 class TorchSnapshotManager:
@@ -37,6 +162,11 @@ class TorchSnapshotManager:
         save_epochs: The number of epochs between each model save
         save_optimizer_state: Whether to store the optimizer state. This makes snapshots
             much heavier, but allows to resume training as if it was never stopped.
+        retained_precision: If "fp16" or "bf16", regular snapshots are written directly
+            with reduced-precision weights and compressed (zstd if installed, else gzip).
+            The best snapshot and the snapshot of the last epoch (last=True) are stored
+            in full precision. Defaults to the DLC_SNAPSHOT_PRECISION environment
+            variable, as the training runner does not pass it.
 
     Examples:
         # Storing snapshots while training
@@ -66,12 +196,19 @@ class TorchSnapshotManager:
     max_snapshots: int = 5
     save_epochs: int = 25
     save_optimizer_state: bool = False
+    retained_precision: str | None = field(
+        default_factory=lambda: os.environ.get(SNAPSHOT_PRECISION_ENV) or None
+    )
     _best_model_epochs: int = -1
     _best_metric: float | None = None
     _key: str = field(init=False)
 
     def __post_init__(self):
         assert self.max_snapshots > 0, f"max_snapshots must be a positive integer"
+        assert self.retained_precision in (None, *SNAPSHOT_PRECISIONS), (
+            f"retained_precision must be one of {list(SNAPSHOT_PRECISIONS)}, "
+            f"found {self.retained_precision}"
+        )
         self._key = f"metrics/{self.key_metric}"
 
     def update(self, epoch: int, state_dict: dict, last: bool = False) -> None:
@@ -132,7 +269,10 @@ class TorchSnapshotManager:
                 for k, v in state_dict.items()
                 if self.save_optimizer_state or k != "optimizer"
             }
-            torch.save(parsed_state_dict, save_path)
+            if self.retained_precision is not None and not last:
+                self._save_compressed(parsed_state_dict, save_path)
+            else:
+                torch.save(parsed_state_dict, save_path)
 
         # Clean up old snapshots if needed
         existing_snapshots = [s for s in self.snapshots() if not s.best]
@@ -142,6 +282,15 @@ class TorchSnapshotManager:
             for snapshot in to_delete:
                 snapshot.path.unlink(missing_ok=False)
 
+    def _save_compressed(self, state_dict: dict, save_path: Path) -> None:
+        """Writes a regular snapshot in reduced precision, compressed, in a single pass"""
+        start = time.perf_counter()
+        codec = save_compressed_snapshot(state_dict, save_path, self.retained_precision)
+        logging.info(
+            f"Saved {save_path.name} ({self.retained_precision}+{codec}): "
+            f"{save_path.stat().st_size / 1e6:.1f} MB in {time.perf_counter() - start:.2f}s"
+        )
+
     def best(self) -> Snapshot | None:
         """Returns: the path to the best snapshot, if it exists"""
         snapshots = self.snapshots()